@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""批量去重模块。
+
+本模块提供了基于NumPy的批量去重函数。所有图片的哈希值依次拼接在一个缓冲区中,
+直接作为定长字节串数组,通过np.unique一次找出每个哈希值第一次出现的位置,无需
+逐个图片查询集合。目标文件夹中已有的图片排在源图片之前,其哈希值第一次出现的
+位置总在源图片之前,源图片中与之相同的哈希值不会被保留。
+
+NumPy为可选依赖,未安装时numpy_available()返回False,调用方应逐个图片去重。
+
+Functions:
+    numpy_available: 判断批量去重是否可用。
+    find_first_occurrences: 找出每个哈希值第一次出现的位置。
+"""
+
+from typing import Union
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def numpy_available() -> bool:
+    """判断批量去重是否可用。
+
+    Returns:
+        安装了NumPy时返回True。
+    """
+    return np is not None
+
+
+def find_first_occurrences(
+    digests: Union[bytes, bytearray, memoryview], digest_size: int
+) -> bytes:
+    """找出每个哈希值第一次出现的位置。
+
+    Args:
+        digests: 按处理顺序依次拼接的二进制哈希值。
+        digest_size: 哈希值的字节数。
+
+    Returns:
+        每个哈希值对应一个字节,第一次出现的位置为1,其余为0。
+
+    Raises:
+        RuntimeError: 如果没有安装NumPy。
+    """
+    if np is None:
+        raise RuntimeError("批量去重需要安装NumPy")
+    if not len(digests):
+        return b""
+
+    digest_array = np.frombuffer(digests, dtype=np.dtype(f"S{digest_size}"))
+    _, first_indexes = np.unique(digest_array, return_index=True)
+    first = np.zeros(len(digest_array), dtype=np.uint8)
+    first[first_indexes] = 1
+    return first.tobytes()
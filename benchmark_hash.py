@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+对比各哈希算法后端在同一批图片上的吞吐量
+
+每种算法对目录下所有图片计算一次完整哈希值，输出耗时和 MB/s。
+第一轮之前会先完整读取一遍所有文件，使各算法都在文件已缓存的条件下比较。
+
+用法：
+    python benchmark_hash.py [图片目录]
+"""
+import os
+import sys
+import time
+
+from file_hasher import available_algorithms
+from images_processor import ImageProcessor
+
+
+def collect_image_paths(directory):
+    """
+    收集目录（含子目录）中的所有图片路径
+    :param directory:
+    :return:
+    """
+    processor = ImageProcessor()
+    image_paths = []
+    for root, _, files in os.walk(directory):
+        for file in files:
+            if processor._is_image_file(file):
+                image_paths.append(os.path.join(root, file))
+    return image_paths
+
+
+def benchmark_algorithm(algorithm, image_paths):
+    """
+    计算指定算法对所有图片做完整哈希的耗时
+    :param algorithm:
+    :param image_paths:
+    :return: 耗时（秒）
+    """
+    processor = ImageProcessor(hash_algorithm=algorithm)
+    start = time.perf_counter()
+    for path in image_paths:
+        processor._get_file_hash(path)
+    return time.perf_counter() - start
+
+
+def main():
+    """
+    主函数
+    :return:
+    """
+    # 使用示例
+    # directory = r"S:\Pictures\"
+    directory = sys.argv[1] if len(sys.argv) > 1 else r"[你的图片路径]"
+    image_paths = collect_image_paths(directory)
+    total_bytes = sum(os.path.getsize(path) for path in image_paths)
+    if not image_paths:
+        print("目录中没有图片")
+        return
+
+    # 预热文件缓存
+    benchmark_algorithm("md5", image_paths)
+
+    total_mb = total_bytes / (1024 * 1024)
+    print(f"{len(image_paths)} 张图片，共 {total_mb:.1f} MB")
+    for algorithm in available_algorithms():
+        elapsed = benchmark_algorithm(algorithm, image_paths)
+        print(f"{algorithm:>10}: {elapsed:8.3f} s  {total_mb / elapsed:10.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,618 @@
+# -*- coding: utf-8 -*-
+"""哈希值集合模块。
+
+本模块提供了一个保存定长二进制哈希值的集合,用于记录已收集图片的哈希值。
+哈希值直接存放在一个连续的bytearray中,以开放寻址(线性探测)解决冲突,不为
+每个哈希值创建bytes对象和集合条目。以16字节的MD5为例,每个哈希值占用约25至50
+字节(取决于距上次扩容的时间),而以十六进制字符串为键的字典每项超过110字节。
+
+哈希值数量超过内存上限时,DigestIndex将内存中的哈希值转存到磁盘上的SQLite
+数据库,并在内存中保留一个布隆过滤器:不在过滤器中的哈希值一定不在磁盘上,
+大部分查询无需访问磁盘。DigestSpool是保存在磁盘上的DigestList,由SQLite找出
+每个哈希值第一次出现的位置,内存中最多只累积memory_limit个待写入的哈希值。
+
+DigestList按顺序保存候选图片的哈希值,同样存放在一个连续的bytearray中,每个
+哈希值只占用digest_size字节。
+
+Classes:
+    DigestList: 定长二进制哈希值列表类。
+    DigestSet: 定长二进制哈希值集合类。
+    BloomFilter: 布隆过滤器类。
+    DigestIndex: 可转存到磁盘的哈希值索引类。
+    DigestSpool: 保存在磁盘上的定长二进制哈希值列表类。
+"""
+
+import math
+import os
+import sqlite3
+import tempfile
+from typing import Iterator, List, Optional, Tuple
+
+from exception_handler import FileAccessError
+
+# 初始槽位数,必须是2的幂
+INITIAL_CAPACITY = 1024
+# 已用槽位超过该比例时扩容一倍
+MAX_LOAD_FACTOR = 2 / 3
+# 布隆过滤器的目标误判率
+BLOOM_FALSE_POSITIVE_RATE = 0.01
+
+
+class DigestList:
+    """定长二进制哈希值列表类。
+
+    哈希值按添加顺序依次存放,不为每个哈希值创建bytes对象。
+
+    Attributes:
+        digest_size (int): 哈希值的字节数。
+    """
+
+    __slots__ = ("digest_size", "_data")
+
+    def __init__(self, digest_size: int):
+        """初始化DigestList类。
+
+        Args:
+            digest_size: 哈希值的字节数。
+        """
+        self.digest_size = digest_size
+        self._data = bytearray()
+
+    def __len__(self) -> int:
+        """获取列表中的哈希值数。
+
+        Returns:
+            哈希值数。
+        """
+        return len(self._data) // self.digest_size
+
+    def __iter__(self) -> Iterator[bytes]:
+        """按添加顺序依次获取哈希值。
+
+        Yields:
+            二进制哈希值。
+        """
+        size = self.digest_size
+        for start in range(0, len(self._data), size):
+            yield bytes(self._data[start : start + size])
+
+    def append(self, digest: bytes) -> None:
+        """在列表末尾添加哈希值。
+
+        Args:
+            digest: 二进制哈希值。
+
+        Raises:
+            ValueError: 如果哈希值的长度与digest_size不符。
+        """
+        if len(digest) != self.digest_size:
+            raise ValueError(f"哈希值长度应为{self.digest_size}字节: {len(digest)}")
+        self._data += digest
+
+    def getbuffer(self) -> memoryview:
+        """获取所有哈希值依次拼接的只读缓冲区,如用于np.frombuffer。
+
+        Returns:
+            只读的内存视图,使用期间不应再添加哈希值。
+        """
+        return memoryview(self._data).toreadonly()
+
+    def close(self) -> None:
+        """释放保存的哈希值。"""
+        self._data = bytearray()
+
+
+class DigestSet:
+    """定长二进制哈希值集合类。
+
+    哈希值本身已经均匀分布,直接以其前8个字节作为槽位索引。
+
+    Attributes:
+        digest_size (int): 哈希值的字节数。
+    """
+
+    __slots__ = ("digest_size", "_slots", "_used", "_mask", "_count")
+
+    def __init__(self, digest_size: int, capacity: int = INITIAL_CAPACITY):
+        """初始化DigestSet类。
+
+        Args:
+            digest_size: 哈希值的字节数。
+            capacity: 初始槽位数,会向上取整为2的幂。
+        """
+        self.digest_size = digest_size
+        self._count = 0
+        self._allocate(1 << max(capacity - 1, 1).bit_length())
+
+    def __len__(self) -> int:
+        """获取集合中的哈希值数。
+
+        Returns:
+            哈希值数。
+        """
+        return self._count
+
+    def __contains__(self, digest: bytes) -> bool:
+        """判断哈希值是否在集合中。
+
+        Args:
+            digest: 二进制哈希值。
+
+        Returns:
+            在集合中返回True。
+        """
+        return self._find(digest)[1]
+
+    def __iter__(self) -> Iterator[bytes]:
+        """依次获取集合中的哈希值。
+
+        Yields:
+            二进制哈希值。
+        """
+        size = self.digest_size
+        for index, used in enumerate(self._used):
+            if used:
+                yield bytes(self._slots[index * size : (index + 1) * size])
+
+    def add(self, digest: bytes) -> bool:
+        """添加哈希值。
+
+        Args:
+            digest: 二进制哈希值。
+
+        Returns:
+            哈希值原本不在集合中、新添加时返回True,已存在时返回False。
+
+        Raises:
+            ValueError: 如果哈希值的长度与digest_size不符。
+        """
+        if len(digest) != self.digest_size:
+            raise ValueError(f"哈希值长度应为{self.digest_size}字节: {len(digest)}")
+        index, found = self._find(digest)
+        if found:
+            return False
+        self._store(index, digest)
+        self._count += 1
+        if self._count > len(self._used) * MAX_LOAD_FACTOR:
+            self._grow()
+        return True
+
+    def discard(self, digest: bytes) -> bool:
+        """删除哈希值。
+
+        删除后将同一探测序列中后面的哈希值前移填补空位,查找时不会在空槽位提前
+        结束。
+
+        Args:
+            digest: 二进制哈希值。
+
+        Returns:
+            哈希值在集合中、已删除时返回True,不在集合中时返回False。
+        """
+        index, found = self._find(digest)
+        if not found:
+            return False
+        size = self.digest_size
+        self._used[index] = 0
+        self._count -= 1
+        next_index = (index + 1) & self._mask
+        while self._used[next_index]:
+            start = next_index * size
+            moved = bytes(self._slots[start : start + size])
+            home = int.from_bytes(moved[:8], "little") & self._mask
+            # 空位在该哈希值的起始槽位和当前槽位之间时,前移到空位
+            if (next_index - home) & self._mask >= (next_index - index) & self._mask:
+                self._store(index, moved)
+                self._used[next_index] = 0
+                index = next_index
+            next_index = (next_index + 1) & self._mask
+        return True
+
+    def _find(self, digest: bytes) -> Tuple[int, bool]:
+        """查找哈希值所在的槽位。
+
+        Args:
+            digest: 二进制哈希值。
+
+        Returns:
+            (槽位索引, 是否找到)。未找到时槽位索引为可以存放该哈希值的空槽位。
+        """
+        size = self.digest_size
+        slots = memoryview(self._slots)
+        index = int.from_bytes(digest[:8], "little") & self._mask
+        while self._used[index]:
+            start = index * size
+            if slots[start : start + size] == digest:
+                return index, True
+            index = (index + 1) & self._mask
+        return index, False
+
+    def _store(self, index: int, digest: bytes) -> None:
+        """将哈希值存入槽位。
+
+        Args:
+            index: 槽位索引。
+            digest: 二进制哈希值。
+        """
+        start = index * self.digest_size
+        self._slots[start : start + self.digest_size] = digest
+        self._used[index] = 1
+
+    def _allocate(self, capacity: int) -> None:
+        """分配指定槽位数的空表。
+
+        Args:
+            capacity: 槽位数,必须是2的幂。
+        """
+        self._slots = bytearray(capacity * self.digest_size)
+        self._used = bytearray(capacity)
+        self._mask = capacity - 1
+
+    def _grow(self) -> None:
+        """将槽位数扩大一倍并重新放入所有哈希值。"""
+        digests = list(self)
+        self._allocate(len(self._used) * 2)
+        for digest in digests:
+            self._store(self._find(digest)[0], digest)
+
+
+class BloomFilter:
+    """布隆过滤器类。
+
+    元素为均匀分布的二进制哈希值,各个位置由其前后两部分通过双重哈希得到:
+    哈希值不少于16字节时取前16个字节分为两个8字节整数,较短的哈希值(如8字节的
+    xxh64)对半分开。
+    """
+
+    __slots__ = ("_bits", "_bit_count", "_hash_count")
+
+    def __init__(
+        self, capacity: int, false_positive_rate: float = BLOOM_FALSE_POSITIVE_RATE
+    ):
+        """初始化BloomFilter类。
+
+        Args:
+            capacity: 预计的元素数,超过后误判率会升高。
+            false_positive_rate: 元素数达到capacity时的误判率。
+        """
+        capacity = max(capacity, 1)
+        self._bit_count = max(
+            8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        )
+        self._hash_count = max(1, round(self._bit_count / capacity * math.log(2)))
+        self._bits = bytearray((self._bit_count + 7) // 8)
+
+    def __contains__(self, digest: bytes) -> bool:
+        """判断元素是否可能在过滤器中。
+
+        Args:
+            digest: 二进制哈希值。
+
+        Returns:
+            可能在过滤器中返回True,一定不在时返回False。
+        """
+        bits = self._bits
+        for position in self._positions(digest):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, digest: bytes) -> None:
+        """添加元素。
+
+        Args:
+            digest: 二进制哈希值。
+        """
+        for position in self._positions(digest):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def _positions(self, digest: bytes) -> Tuple[int, ...]:
+        """计算元素对应的各个位置。
+
+        Args:
+            digest: 二进制哈希值。
+
+        Returns:
+            位置元组。
+        """
+        half = min(len(digest) // 2, 8)
+        first = int.from_bytes(digest[:half], "little")
+        second = int.from_bytes(digest[half : 2 * half], "little") | 1
+        return tuple(
+            (first + i * second) % self._bit_count for i in range(self._hash_count)
+        )
+
+
+class DigestIndex:
+    """可转存到磁盘的哈希值索引类。
+
+    哈希值先保存在内存中的DigestSet里,数量达到memory_limit时全部写入磁盘上的
+    临时SQLite数据库并清空内存。磁盘上的哈希值同时加入布隆过滤器,查询时只有
+    过滤器判断可能存在的哈希值才访问磁盘。memory_limit为0时不转存。
+
+    Attributes:
+        digest_size (int): 哈希值的字节数。
+        memory_limit (int): 内存中最多保存的哈希值数,0表示不限制。
+    """
+
+    def __init__(
+        self,
+        digest_size: int,
+        memory_limit: int = 0,
+        spill_dir: Optional[str] = None,
+        expected_count: int = 0,
+    ):
+        """初始化DigestIndex类。
+
+        Args:
+            digest_size: 哈希值的字节数。
+            memory_limit: 内存中最多保存的哈希值数,0表示不限制。
+            spill_dir: 转存数据库所在的文件夹,默认为系统临时文件夹。
+            expected_count: 预计的哈希值总数,用于确定布隆过滤器的大小。
+        """
+        self.digest_size = digest_size
+        self.memory_limit = memory_limit
+        self._spill_dir = spill_dir
+        self._expected_count = expected_count
+        self._memory = DigestSet(digest_size)
+        self._spilled_count = 0
+        self._bloom: Optional[BloomFilter] = None
+        self._connection: Optional[sqlite3.Connection] = None
+        self._db_path: Optional[str] = None
+
+    def __len__(self) -> int:
+        """获取索引中的哈希值数。
+
+        Returns:
+            哈希值数。
+        """
+        return len(self._memory) + self._spilled_count
+
+    def __contains__(self, digest: bytes) -> bool:
+        """判断哈希值是否在索引中。
+
+        Args:
+            digest: 二进制哈希值。
+
+        Returns:
+            在索引中返回True。
+        """
+        return digest in self._memory or self._is_spilled(digest)
+
+    def add(self, digest: bytes) -> bool:
+        """添加哈希值。
+
+        添加的同时判断哈希值是否已存在,调用方无需先查询。
+
+        Args:
+            digest: 二进制哈希值。
+
+        Returns:
+            哈希值原本不在索引中、新添加时返回True,已存在时返回False。
+
+        Raises:
+            ValueError: 如果哈希值的长度与digest_size不符。
+            FileAccessError: 如果无法写入转存数据库。
+        """
+        if self._is_spilled(digest) or not self._memory.add(digest):
+            return False
+        if self.memory_limit and len(self._memory) >= self.memory_limit:
+            self._spill()
+        return True
+
+    def discard(self, digest: bytes) -> None:
+        """删除哈希值,如撤销复制失败的图片的哈希值。
+
+        磁盘上的哈希值删除后仍留在布隆过滤器中,只会使查询多访问一次磁盘。
+
+        Args:
+            digest: 二进制哈希值。
+        """
+        if self._memory.discard(digest) or not self._is_spilled(digest):
+            return
+        self._connection.execute("DELETE FROM digests WHERE digest = ?", (digest,))
+        self._spilled_count -= 1
+
+    def close(self) -> None:
+        """关闭并删除转存数据库。"""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        if self._db_path is not None:
+            os.remove(self._db_path)
+            self._db_path = None
+
+    def _is_spilled(self, digest: bytes) -> bool:
+        """判断哈希值是否在转存数据库中。
+
+        Args:
+            digest: 二进制哈希值。
+
+        Returns:
+            在转存数据库中返回True。
+        """
+        if self._bloom is None or digest not in self._bloom:
+            return False
+        row = self._connection.execute(
+            "SELECT 1 FROM digests WHERE digest = ?", (digest,)
+        ).fetchone()
+        return row is not None
+
+    def _spill(self) -> None:
+        """将内存中的哈希值写入转存数据库并清空内存。
+
+        Raises:
+            FileAccessError: 如果无法创建或写入转存数据库。
+        """
+        if self._connection is None:
+            self._open_spill_database()
+        digests = list(self._memory)
+        try:
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR IGNORE INTO digests (digest) VALUES (?)",
+                    ((digest,) for digest in digests),
+                )
+        except sqlite3.Error as e:
+            raise FileAccessError(self._db_path, str(e))
+        for digest in digests:
+            self._bloom.add(digest)
+        self._spilled_count += len(digests)
+        self._memory = DigestSet(self.digest_size)
+
+    def _open_spill_database(self) -> None:
+        """创建转存数据库和布隆过滤器。
+
+        Raises:
+            FileAccessError: 如果无法创建数据库。
+        """
+        self._connection, self._db_path = _open_temp_database(
+            self._spill_dir,
+            "CREATE TABLE digests (digest BLOB PRIMARY KEY) WITHOUT ROWID",
+        )
+        self._bloom = BloomFilter(max(self._expected_count, 2 * self.memory_limit))
+
+
+class DigestSpool:
+    """保存在磁盘上的定长二进制哈希值列表类。
+
+    哈希值按添加顺序写入临时SQLite数据库,内存中累积memory_limit个后批量写入。
+    添加完成后由SQLite按(哈希值, 位置)索引找出每个哈希值第一次出现的位置,
+    结果按添加顺序逐行读取,不在内存中保存所有哈希值。
+
+    Attributes:
+        digest_size (int): 哈希值的字节数。
+        memory_limit (int): 内存中最多累积的待写入哈希值数。
+    """
+
+    def __init__(
+        self, digest_size: int, memory_limit: int, spill_dir: Optional[str] = None
+    ):
+        """初始化DigestSpool类。
+
+        Args:
+            digest_size: 哈希值的字节数。
+            memory_limit: 内存中最多累积的待写入哈希值数。
+            spill_dir: 数据库所在的文件夹,默认为系统临时文件夹。
+
+        Raises:
+            FileAccessError: 如果无法创建数据库。
+        """
+        self.digest_size = digest_size
+        self.memory_limit = max(1, memory_limit)
+        self._count = 0
+        self._pending: List[bytes] = []
+        self._connection, self._db_path = _open_temp_database(
+            spill_dir,
+            "CREATE TABLE digests "
+            "(position INTEGER PRIMARY KEY, digest BLOB NOT NULL)",
+        )
+
+    def __len__(self) -> int:
+        """获取列表中的哈希值数。
+
+        Returns:
+            哈希值数。
+        """
+        return self._count
+
+    def append(self, digest: bytes) -> None:
+        """在列表末尾添加哈希值。
+
+        Args:
+            digest: 二进制哈希值。
+
+        Raises:
+            ValueError: 如果哈希值的长度与digest_size不符。
+            FileAccessError: 如果无法写入数据库。
+        """
+        if len(digest) != self.digest_size:
+            raise ValueError(f"哈希值长度应为{self.digest_size}字节: {len(digest)}")
+        self._pending.append(digest)
+        self._count += 1
+        if len(self._pending) >= self.memory_limit:
+            self._flush()
+
+    def iter_first_occurrences(self) -> Iterator[Tuple[bytes, bool]]:
+        """按添加顺序依次获取哈希值及其是否第一次出现。
+
+        开始读取后不应再添加哈希值。
+
+        Yields:
+            (二进制哈希值, 是否第一次出现)。
+
+        Raises:
+            FileAccessError: 如果无法读取数据库。
+        """
+        self._flush()
+        try:
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS digest_positions "
+                "ON digests (digest, position)"
+            )
+            cursor = self._connection.execute(
+                "SELECT digest, NOT EXISTS ("
+                "SELECT 1 FROM digests AS earlier "
+                "WHERE earlier.digest = digests.digest "
+                "AND earlier.position < digests.position"
+                ") FROM digests ORDER BY position"
+            )
+            for digest, is_first in cursor:
+                yield digest, bool(is_first)
+        except sqlite3.Error as e:
+            raise FileAccessError(self._db_path, str(e))
+
+    def close(self) -> None:
+        """关闭并删除数据库。"""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        if self._db_path is not None:
+            os.remove(self._db_path)
+            self._db_path = None
+
+    def _flush(self) -> None:
+        """将累积的哈希值写入数据库。
+
+        Raises:
+            FileAccessError: 如果无法写入数据库。
+        """
+        if not self._pending:
+            return
+        try:
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT INTO digests (digest) VALUES (?)",
+                    ((digest,) for digest in self._pending),
+                )
+        except sqlite3.Error as e:
+            raise FileAccessError(self._db_path, str(e))
+        self._pending = []
+
+
+def _open_temp_database(
+    spill_dir: Optional[str], schema: str
+) -> Tuple[sqlite3.Connection, str]:
+    """创建只在本次运行中使用的临时SQLite数据库。
+
+    Args:
+        spill_dir: 数据库所在的文件夹,为None时使用系统临时文件夹。
+        schema: 建表语句。
+
+    Returns:
+        (数据库连接, 数据库文件路径)。
+
+    Raises:
+        FileAccessError: 如果无法创建数据库。
+    """
+    fd, db_path = tempfile.mkstemp(suffix=".sqlite3", prefix=".dedup_", dir=spill_dir)
+    os.close(fd)
+    try:
+        connection = sqlite3.connect(db_path)
+        connection.execute("PRAGMA journal_mode=OFF")
+        connection.execute("PRAGMA synchronous=OFF")
+        connection.execute(schema)
+    except sqlite3.Error as e:
+        os.remove(db_path)
+        raise FileAccessError(db_path, str(e))
+    return connection, db_path
@@ -9,6 +9,7 @@ Classes:
     HashCalculationError: 哈希计算错误。
     ImageCopyError: 图片复制错误。
     ImageRenameError: 图片重命名错误。
+    ProcessingCancelledError: 图片处理已取消。
 """
 
 class ImageProcessorError(Exception):
@@ -44,3 +45,8 @@ class ImageRenameError(ImageProcessorError):
         self.new_path = new_path
         self.message = message
         super().__init__(f"重命名图片从 {old_path} 到 {new_path} 时出错: {message}")
+
+class ProcessingCancelledError(ImageProcessorError):
+    """图片处理已取消。"""
+    def __init__(self):
+        super().__init__("图片处理已取消")
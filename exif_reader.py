@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""EXIF日期读取模块。
+
+本模块提供了不经过Pillow解码、直接从JPEG文件头读取拍摄日期的函数。JPEG的EXIF
+数据保存在图像数据之前的APP1段中,只需依次读取各段的段头并跳过其他段,找到
+APP1段后解析其中的TIFF结构即可得到日期,通常只读取文件开头的几KB。
+
+计算哈希值时已经读取的文件开头数据也可以直接解析,一次得到EXIF日期、图片尺寸
+和格式,之后无需再打开文件。
+
+Classes:
+    ImageInfo: 从文件开头解析出的图片信息。
+
+Functions:
+    read_exif_date: 从JPEG文件读取EXIF日期。
+    parse_exif_date: 从JPEG数据流读取EXIF日期。
+    parse_image_info: 从文件开头的数据解析图片信息。
+"""
+
+import io
+import struct
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, NamedTuple, Optional, Tuple
+
+# JPEG文件开头的SOI标记
+JPEG_SOI = b"\xff\xd8"
+# APP1段中EXIF数据的标识
+EXIF_HEADER = b"Exif\x00\x00"
+# EXIF日期的格式
+EXIF_DATE_FORMAT = "%Y:%m:%d %H:%M:%S"
+# 解析图片信息时使用的文件开头字节数
+HEADER_SIZE = 64 * 1024
+# PNG文件的签名
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# 段标记
+_APP1 = 0xE1
+_SOS = 0xDA
+_EOI = 0xD9
+# 没有长度字段的段标记
+_STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD8)}
+# 包含图片尺寸的帧开始(SOF)段标记
+_SOF_MARKERS = {*range(0xC0, 0xD0)} - {0xC4, 0xC8, 0xCC}
+
+# TIFF标签
+_TAG_DATE_TIME = 0x0132
+_TAG_EXIF_IFD = 0x8769
+_TAG_DATE_TIME_ORIGINAL = 0x9003
+# TIFF中ASCII类型的编号
+_TYPE_ASCII = 2
+
+# (类型, 数量, 值或值的偏移量所在位置)
+IfdEntry = Tuple[int, int, int]
+
+
+class ImageInfo(NamedTuple):
+    """从文件开头解析出的图片信息。
+
+    Attributes:
+        format: 图片格式,与Pillow的格式名称相同,如JPEG、PNG。
+        width: 图片宽度,无法从文件开头得到时为None。
+        height: 图片高度,无法从文件开头得到时为None。
+        exif_date: EXIF中的日期,没有时为None。
+    """
+
+    format: str
+    width: Optional[int]
+    height: Optional[int]
+    exif_date: Optional[datetime]
+
+
+def read_exif_date(file_path: str) -> Optional[datetime]:
+    """从JPEG文件读取EXIF日期。
+
+    依次使用DateTimeOriginal和DateTime标签中的日期。
+
+    Args:
+        file_path: 图片文件路径。
+
+    Returns:
+        EXIF日期,没有EXIF数据或其中没有有效日期时返回None。
+
+    Raises:
+        ValueError: 如果文件不是JPEG或EXIF数据无法解析,调用方应改用完整的解析方式。
+        OSError: 如果无法读取文件。
+    """
+    with open(file_path, "rb") as f:
+        return parse_exif_date(f)
+
+
+def parse_exif_date(stream: BinaryIO) -> Optional[datetime]:
+    """从JPEG数据流读取EXIF日期。
+
+    Args:
+        stream: 位于JPEG数据开头、以二进制模式读取的数据流。
+
+    Returns:
+        EXIF日期,没有EXIF数据或其中没有有效日期时返回None。
+
+    Raises:
+        ValueError: 如果数据不是JPEG或EXIF数据无法解析。
+    """
+    for marker_type, segment in _iter_jpeg_segments(stream):
+        if marker_type == _APP1 and segment.startswith(EXIF_HEADER):
+            return _parse_tiff_date(segment[len(EXIF_HEADER) :])
+    return None
+
+
+def parse_image_info(head: bytes) -> Optional[ImageInfo]:
+    """从文件开头的数据解析图片信息。
+
+    支持JPEG、PNG、GIF和BMP。只有JPEG可能包含EXIF日期;JPEG的EXIF段不完整时
+    无法确定日期,返回None。解析只是顺带进行的,数据无法解析时也返回None,
+    不抛出异常。
+
+    Args:
+        head: 文件开头的数据,通常为HEADER_SIZE字节。
+
+    Returns:
+        图片信息,格式不受支持、数据无法解析或不足以确定EXIF日期时返回None。
+    """
+    try:
+        return _parse_image_info(head)
+    except (ValueError, struct.error):
+        return None
+
+
+def _parse_image_info(head: bytes) -> Optional[ImageInfo]:
+    """从文件开头的数据解析图片信息。
+
+    Args:
+        head: 文件开头的数据。
+
+    Returns:
+        图片信息,格式不受支持或数据不足以确定EXIF日期时返回None。
+
+    Raises:
+        ValueError: 如果数据无法解析。
+        struct.error: 如果数据不完整。
+    """
+    if head.startswith(JPEG_SOI):
+        return _parse_jpeg_info(head)
+    if head.startswith(PNG_SIGNATURE) and head[12:16] == b"IHDR" and len(head) >= 24:
+        width, height = struct.unpack_from(">II", head, 16)
+        return ImageInfo("PNG", width, height, None)
+    if head[:6] in (b"GIF87a", b"GIF89a") and len(head) >= 10:
+        width, height = struct.unpack_from("<HH", head, 6)
+        return ImageInfo("GIF", width, height, None)
+    if head.startswith(b"BM") and len(head) >= 26:
+        (header_size,) = struct.unpack_from("<I", head, 14)
+        if header_size == 12:
+            width, height = struct.unpack_from("<HH", head, 18)
+        else:
+            width, height = struct.unpack_from("<ii", head, 18)
+        return ImageInfo("BMP", width, abs(height), None)
+    return None
+
+
+def _parse_jpeg_info(head: bytes) -> Optional[ImageInfo]:
+    """从JPEG文件开头的数据解析图片信息。
+
+    与Pillow一样使用第一个EXIF段中的日期。
+
+    Args:
+        head: 文件开头的数据。
+
+    Returns:
+        图片信息,数据不足以确定EXIF日期或EXIF无法解析时返回None。
+    """
+    exif_found = False
+    exif_date: Optional[datetime] = None
+    size: Optional[Tuple[int, int]] = None
+    try:
+        for marker_type, segment in _iter_jpeg_segments(io.BytesIO(head)):
+            if marker_type in _SOF_MARKERS and size is None and len(segment) >= 5:
+                height, width = struct.unpack_from(">HH", segment, 1)
+                size = (width, height)
+            elif (
+                marker_type == _APP1
+                and not exif_found
+                and segment.startswith(EXIF_HEADER)
+            ):
+                exif_date = _parse_tiff_date(segment[len(EXIF_HEADER) :])
+                exif_found = True
+    except ValueError:
+        # 文件开头数据不完整,只有已找到EXIF段时才能确定日期
+        if not exif_found:
+            return None
+    width, height = size if size is not None else (None, None)
+    return ImageInfo("JPEG", width, height, exif_date)
+
+
+def _iter_jpeg_segments(stream: BinaryIO) -> Iterator[Tuple[int, bytes]]:
+    """依次读取JPEG数据中图像数据之前的APP1段和SOF段。
+
+    其他段只读取段头后跳过,遇到SOS或EOI时结束。
+
+    Args:
+        stream: 位于JPEG数据开头的数据流。
+
+    Yields:
+        (段标记, 段数据)。
+
+    Raises:
+        ValueError: 如果数据不是JPEG或段结构不完整。
+    """
+    if stream.read(2) != JPEG_SOI:
+        raise ValueError("不是JPEG文件")
+
+    while True:
+        marker = _read_exact(stream, 2)
+        if marker[0] != 0xFF:
+            raise ValueError("JPEG段标记无效")
+        # 标记前可以有任意个0xFF填充字节
+        while marker[1] == 0xFF:
+            marker = marker[1:] + _read_exact(stream, 1)
+        marker_type = marker[1]
+        if marker_type in (_SOS, _EOI):
+            return
+        if marker_type in _STANDALONE_MARKERS:
+            continue
+
+        (length,) = struct.unpack(">H", _read_exact(stream, 2))
+        if length < 2:
+            raise ValueError("JPEG段长度无效")
+        if marker_type != _APP1 and marker_type not in _SOF_MARKERS:
+            stream.seek(length - 2, 1)
+            continue
+        yield marker_type, _read_exact(stream, length - 2)
+
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    """从数据流中读取指定字节数。
+
+    Args:
+        stream: 数据流。
+        size: 字节数。
+
+    Returns:
+        读取的数据。
+
+    Raises:
+        ValueError: 如果数据不足。
+    """
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("JPEG数据不完整")
+    return data
+
+
+def _parse_tiff_date(data: bytes) -> Optional[datetime]:
+    """从EXIF段的TIFF数据中解析日期。
+
+    Args:
+        data: TIFF数据。
+
+    Returns:
+        DateTimeOriginal或DateTime标签中的日期,都没有有效日期时返回None。
+
+    Raises:
+        ValueError: 如果TIFF结构无法解析。
+    """
+    if data[:2] == b"II":
+        endian = "<"
+    elif data[:2] == b"MM":
+        endian = ">"
+    else:
+        raise ValueError("TIFF字节序无效")
+    try:
+        magic, ifd0_offset = struct.unpack_from(endian + "HI", data, 2)
+        if magic != 42:
+            raise ValueError("TIFF标识无效")
+
+        ifd0 = _read_ifd(data, ifd0_offset, endian)
+        exif_ifd: Dict[int, IfdEntry] = {}
+        if _TAG_EXIF_IFD in ifd0:
+            _, _, position = ifd0[_TAG_EXIF_IFD]
+            (exif_offset,) = struct.unpack_from(endian + "I", data, position)
+            exif_ifd = _read_ifd(data, exif_offset, endian)
+
+        for ifd, tag in ((exif_ifd, _TAG_DATE_TIME_ORIGINAL), (ifd0, _TAG_DATE_TIME)):
+            if tag in ifd:
+                date = _read_date(data, ifd[tag], endian)
+                if date is not None:
+                    return date
+    except struct.error as e:
+        raise ValueError(f"TIFF数据不完整: {e}") from e
+    return None
+
+
+def _read_ifd(data: bytes, offset: int, endian: str) -> Dict[int, IfdEntry]:
+    """读取一个IFD中的所有条目。
+
+    Args:
+        data: TIFF数据。
+        offset: IFD在TIFF数据中的偏移量。
+        endian: struct格式的字节序。
+
+    Returns:
+        标签到(类型, 数量, 值或值的偏移量所在位置)的字典。
+
+    Raises:
+        struct.error: 如果数据不完整。
+    """
+    (count,) = struct.unpack_from(endian + "H", data, offset)
+    entries: Dict[int, IfdEntry] = {}
+    for index in range(count):
+        position = offset + 2 + index * 12
+        tag, value_type, value_count = struct.unpack_from(
+            endian + "HHI", data, position
+        )
+        entries[tag] = (value_type, value_count, position + 8)
+    return entries
+
+
+def _read_date(data: bytes, entry: IfdEntry, endian: str) -> Optional[datetime]:
+    """读取ASCII类型的日期标签。
+
+    Args:
+        data: TIFF数据。
+        entry: 标签条目。
+        endian: struct格式的字节序。
+
+    Returns:
+        标签中的日期,不是有效日期时返回None。
+
+    Raises:
+        struct.error: 如果值的偏移量不完整。
+    """
+    value_type, value_count, position = entry
+    if value_type != _TYPE_ASCII:
+        return None
+    if value_count > 4:
+        (position,) = struct.unpack_from(endian + "I", data, position)
+    value = data[position : position + value_count].split(b"\x00", 1)[0]
+    try:
+        return datetime.strptime(value.decode("ascii").strip(), EXIF_DATE_FORMAT)
+    except ValueError:
+        return None
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""文件复制模块。
+
+本模块提供了复制图片文件的函数。复制数据时优先使用内核完成复制的
+os.copy_file_range,不可用时依次回退到os.sendfile和使用大缓冲区的用户态复制,
+使图片数据尽量不经过Python。复制完成后与shutil.copy2一样复制文件元数据。
+
+源文件和目标位置在同一文件系统上时,还可以用硬链接、reflink(写时复制克隆)
+或符号链接代替复制,不占用额外的磁盘空间。不需要保留源文件时可以移动文件:
+同一设备上直接重命名,跨设备时复制并校验后再删除源文件。
+
+Functions:
+    link_or_copy_file: 按指定方式在目标位置创建文件。
+    copy_file: 复制文件内容和元数据。
+    copy_file_data: 在两个已打开的文件之间复制数据。
+"""
+
+import errno
+import os
+import shutil
+import sys
+import uuid
+from typing import BinaryIO, Callable
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from file_hasher import DEFAULT_BUFFER_SIZE, copy_and_hash, hash_file
+
+# 支持的创建方式
+LINK_MODES = ("copy", "hardlink", "reflink", "symlink", "move")
+# 跨设备移动时校验复制结果使用的哈希算法
+VERIFY_ALGORITHM = "blake2b"
+# Linux的FICLONE ioctl请求号
+FICLONE = 0x40049409
+
+# 单次系统调用复制的最大字节数
+MAX_CHUNK_SIZE = 1024 * 1024 * 1024
+
+# 表示当前文件或文件系统不支持该复制方式、可以回退的错误码
+_FALLBACK_ERRNOS = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EBADF,
+    errno.EOPNOTSUPP,
+    getattr(errno, "ENOTSUP", errno.EOPNOTSUPP),
+}
+
+_HAS_COPY_FILE_RANGE = hasattr(os, "copy_file_range")
+# 只有Linux的sendfile支持输出到普通文件
+_HAS_SENDFILE = hasattr(os, "sendfile") and sys.platform.startswith("linux")
+
+
+def link_or_copy_file(
+    source_path: str,
+    target_path: str,
+    link_mode: str = "copy",
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+) -> str:
+    """按指定方式在目标位置创建文件。
+
+    硬链接、reflink和符号链接无法创建时(如跨文件系统、文件系统不支持或没有
+    权限)回退为复制。move会移除源文件。目标路径已存在时会被替换,调用方可以
+    先创建空文件预留目标路径。
+
+    Args:
+        source_path: 源文件路径。
+        target_path: 目标文件路径。
+        link_mode: 创建方式,copy、hardlink、reflink、symlink或move。
+        buffer_size: 用户态复制时的缓冲区大小。
+
+    Returns:
+        实际使用的创建方式。
+
+    Raises:
+        OSError: 如果复制或移动失败。
+    """
+    if link_mode == "move":
+        return move_file(source_path, target_path, buffer_size)
+    if link_mode == "hardlink" and _try_link(os.link, source_path, target_path):
+        return "hardlink"
+    if link_mode == "symlink" and _try_link(
+        os.symlink, os.path.abspath(source_path), target_path
+    ):
+        return "symlink"
+    if link_mode == "reflink" and _reflink(source_path, target_path):
+        shutil.copystat(source_path, target_path)
+        return "reflink"
+    copy_file(source_path, target_path, buffer_size)
+    return "copy"
+
+
+def move_file(
+    source_path: str, target_path: str, buffer_size: int = DEFAULT_BUFFER_SIZE
+) -> str:
+    """移动文件。
+
+    源文件与目标位置在同一设备上时直接重命名,只修改目录项;否则先复制,校验
+    目标文件内容与源文件一致后再删除源文件。
+
+    Args:
+        source_path: 源文件路径。
+        target_path: 目标文件路径。
+        buffer_size: 跨设备复制时的缓冲区大小。
+
+    Returns:
+        同一设备上重命名返回"move",跨设备复制后删除返回"copy"。
+
+    Raises:
+        OSError: 如果移动失败或复制结果校验失败。失败时源文件保持不变。
+    """
+    target_dir = os.path.dirname(os.path.abspath(target_path))
+    if os.stat(source_path).st_dev == os.stat(target_dir).st_dev:
+        try:
+            os.replace(source_path, target_path)
+            return "move"
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+
+    with open(target_path, "wb") as target:
+        digest = copy_and_hash(source_path, target, VERIFY_ALGORITHM, buffer_size)
+    shutil.copystat(source_path, target_path)
+    if hash_file(target_path, VERIFY_ALGORITHM, buffer_size=buffer_size) != digest:
+        os.remove(target_path)
+        raise OSError(errno.EIO, "复制后校验失败", target_path)
+    os.remove(source_path)
+    return "copy"
+
+
+def _try_link(
+    link_func: Callable[[str, str], None], source_path: str, target_path: str
+) -> bool:
+    """尝试创建硬链接或符号链接。
+
+    链接先创建在同一文件夹的临时路径上,再原子地替换目标路径。
+
+    Args:
+        link_func: os.link或os.symlink。
+        source_path: 源文件路径。
+        target_path: 目标文件路径。
+
+    Returns:
+        创建成功返回True,否则返回False。
+
+    Raises:
+        OSError: 如果链接已创建但无法替换目标路径。
+    """
+    target_dir, target_name = os.path.split(target_path)
+    temp_path = os.path.join(target_dir, f".{target_name}.{uuid.uuid4().hex}.link")
+    try:
+        link_func(source_path, temp_path)
+    except OSError:
+        return False
+    try:
+        os.replace(temp_path, target_path)
+    except OSError:
+        os.remove(temp_path)
+        raise
+    return True
+
+
+def _reflink(source_path: str, target_path: str) -> bool:
+    """尝试通过FICLONE创建共享数据块的克隆文件。
+
+    Args:
+        source_path: 源文件路径。
+        target_path: 目标文件路径。
+
+    Returns:
+        克隆成功返回True,平台或文件系统不支持时返回False。
+    """
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    with open(source_path, "rb") as source, open(target_path, "wb") as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError:
+            return False
+    return True
+
+
+def copy_file(
+    source_path: str, target_path: str, buffer_size: int = DEFAULT_BUFFER_SIZE
+) -> None:
+    """复制文件内容和元数据。
+
+    Args:
+        source_path: 源文件路径。
+        target_path: 目标文件路径。
+        buffer_size: 用户态复制时的缓冲区大小。
+
+    Raises:
+        OSError: 如果复制失败。
+    """
+    with open(source_path, "rb") as source, open(target_path, "wb") as target:
+        copy_file_data(source, target, buffer_size)
+    shutil.copystat(source_path, target_path)
+
+
+def copy_file_data(
+    source: BinaryIO, target: BinaryIO, buffer_size: int = DEFAULT_BUFFER_SIZE
+) -> None:
+    """将源文件从当前位置起的数据复制到目标文件。
+
+    Args:
+        source: 以二进制读模式打开的源文件。
+        target: 以二进制写模式打开的目标文件。
+        buffer_size: 用户态复制时的缓冲区大小。
+
+    Raises:
+        OSError: 如果复制失败。
+    """
+    source_fd = source.fileno()
+    target_fd = target.fileno()
+    size = os.fstat(source_fd).st_size - source.tell()
+    target.flush()
+    if size <= 0:
+        return
+    if _HAS_COPY_FILE_RANGE and _copy_with_kernel(
+        os.copy_file_range, source_fd, target_fd, size
+    ):
+        return
+    if _HAS_SENDFILE and _copy_with_kernel(_sendfile, source_fd, target_fd, size):
+        return
+    _copy_with_buffer(source, target, buffer_size)
+
+
+def _sendfile(source_fd: int, target_fd: int, count: int) -> int:
+    """以与os.copy_file_range相同的参数顺序调用os.sendfile。
+
+    Args:
+        source_fd: 源文件描述符。
+        target_fd: 目标文件描述符。
+        count: 最多复制的字节数。
+
+    Returns:
+        实际复制的字节数。
+    """
+    return os.sendfile(target_fd, source_fd, None, count)
+
+
+def _copy_with_kernel(
+    copy_func: Callable[[int, int, int], int], source_fd: int, target_fd: int, size: int
+) -> bool:
+    """使用内核复制函数复制文件数据。
+
+    Args:
+        copy_func: os.copy_file_range或_sendfile。
+        source_fd: 源文件描述符。
+        target_fd: 目标文件描述符。
+        size: 要复制的字节数。
+
+    Returns:
+        复制完成返回True;尚未复制任何数据时遇到不支持的情况返回False,
+        调用方应回退到其他复制方式。
+
+    Raises:
+        OSError: 如果已复制部分数据后出错,或出现其他错误。
+    """
+    copied = 0
+    try:
+        while copied < size:
+            sent = copy_func(source_fd, target_fd, min(size - copied, MAX_CHUNK_SIZE))
+            if sent == 0:
+                break
+            copied += sent
+    except OSError as e:
+        if copied == 0 and e.errno in _FALLBACK_ERRNOS:
+            return False
+        raise
+    # 某些文件系统(如procfs)对内核复制直接返回0
+    return copied > 0
+
+
+def _copy_with_buffer(source: BinaryIO, target: BinaryIO, buffer_size: int) -> None:
+    """使用预先分配的缓冲区在用户态复制文件数据。
+
+    Args:
+        source: 源文件。
+        target: 目标文件。
+        buffer_size: 缓冲区大小。
+    """
+    buffer = memoryview(bytearray(buffer_size))
+    while True:
+        read_size = source.readinto(buffer)
+        if not read_size:
+            break
+        target.write(buffer[:read_size])
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""文件哈希模块。
+
+本模块提供了可选择的哈希算法后端,用于计算图片文件的哈希值去重。
+hashlib 中的算法始终可用;xxhash 和 blake3 仅在安装了对应的库时可用,
+否则回退到 hashlib 的 blake2b。
+
+读取文件时复用每个线程预先分配的缓冲区(readinto),避免每次读取都创建新的
+bytes对象;超过阈值的大文件直接通过mmap计算哈希值。计算哈希值时还可以同时
+取得文件开头的数据,用于解析图片信息,无需再次读取文件。
+
+Functions:
+    available_algorithms: 获取当前环境可用的哈希算法。
+    resolve_algorithm: 将算法名称解析为当前环境可用的算法。
+    create_hasher: 创建哈希对象。
+    hash_file: 计算文件的哈希值。
+    hash_file_with_head: 计算文件的哈希值,同时取得文件开头的数据。
+    copy_and_hash: 复制文件的同时计算其哈希值。
+    copy_and_hash_with_head: 复制文件并计算哈希值,同时取得文件开头的数据。
+"""
+
+import hashlib
+import mmap
+import os
+import threading
+from typing import BinaryIO, Callable, Dict, List, Tuple
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+# 可选算法不可用时回退使用的算法
+FALLBACK_ALGORITHM = "blake2b"
+# 默认读取缓冲区大小
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+# 不小于该大小的文件通过mmap计算哈希值,0表示不使用mmap
+DEFAULT_MMAP_THRESHOLD = 16 * 1024 * 1024
+
+_local = threading.local()
+
+_HASHLIB_ALGORITHMS: Dict[str, Callable] = {
+    "md5": hashlib.md5,
+    "sha1": hashlib.sha1,
+    "sha256": hashlib.sha256,
+    "blake2b": hashlib.blake2b,
+}
+
+_OPTIONAL_ALGORITHMS: Dict[str, Callable] = {}
+if xxhash is not None:
+    _OPTIONAL_ALGORITHMS["xxh64"] = xxhash.xxh64
+    _OPTIONAL_ALGORITHMS["xxh3_128"] = xxhash.xxh3_128
+if blake3 is not None:
+    _OPTIONAL_ALGORITHMS["blake3"] = blake3.blake3
+
+_KNOWN_OPTIONAL_ALGORITHMS = ("xxh64", "xxh3_128", "blake3")
+
+
+def available_algorithms() -> List[str]:
+    """获取当前环境可用的哈希算法。
+
+    Returns:
+        可用的哈希算法名称列表。
+    """
+    return list(_HASHLIB_ALGORITHMS) + list(_OPTIONAL_ALGORITHMS)
+
+
+def resolve_algorithm(algorithm: str) -> str:
+    """将算法名称解析为当前环境可用的算法。
+
+    Args:
+        algorithm: 哈希算法名称。
+
+    Returns:
+        可用的算法名称。可选算法未安装时返回回退算法。
+
+    Raises:
+        ValueError: 如果算法名称未知。
+    """
+    algorithm = algorithm.lower()
+    if algorithm in _HASHLIB_ALGORITHMS or algorithm in _OPTIONAL_ALGORITHMS:
+        return algorithm
+    if algorithm in _KNOWN_OPTIONAL_ALGORITHMS:
+        return FALLBACK_ALGORITHM
+    raise ValueError(f"不支持的哈希算法: {algorithm}")
+
+
+def create_hasher(algorithm: str) -> object:
+    """创建哈希对象。
+
+    Args:
+        algorithm: 已解析的哈希算法名称。
+
+    Returns:
+        支持update()和hexdigest()的哈希对象。
+    """
+    factory = _HASHLIB_ALGORITHMS.get(algorithm) or _OPTIONAL_ALGORITHMS[algorithm]
+    return factory()
+
+
+def _get_buffer(buffer_size: int) -> memoryview:
+    """获取当前线程复用的读取缓冲区。
+
+    Args:
+        buffer_size: 缓冲区大小。
+
+    Returns:
+        缓冲区的memoryview。
+    """
+    buffer = getattr(_local, "buffer", None)
+    if buffer is None or len(buffer) != buffer_size:
+        buffer = memoryview(bytearray(buffer_size))
+        _local.buffer = buffer
+    return buffer
+
+
+def hash_file(
+    file_path: str,
+    algorithm: str,
+    sample_size: int = 0,
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+    mmap_threshold: int = DEFAULT_MMAP_THRESHOLD,
+) -> str:
+    """计算文件的哈希值。
+
+    Args:
+        file_path: 文件路径。
+        algorithm: 已解析的哈希算法名称。
+        sample_size: 抽样字节数。大于0时只计算文件头部和尾部各sample_size字节的
+            哈希值;文件不大于2*sample_size时与完整哈希值相同。
+        buffer_size: 读取缓冲区大小。
+        mmap_threshold: 不小于该大小的文件通过mmap计算哈希值,0表示不使用mmap。
+
+    Returns:
+        文件的哈希值。
+
+    Raises:
+        OSError: 如果读取文件失败。
+    """
+    return hash_file_with_head(
+        file_path, algorithm, 0, sample_size, buffer_size, mmap_threshold
+    )[0]
+
+
+def hash_file_with_head(
+    file_path: str,
+    algorithm: str,
+    head_size: int,
+    sample_size: int = 0,
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+    mmap_threshold: int = DEFAULT_MMAP_THRESHOLD,
+) -> Tuple[str, bytes]:
+    """计算文件的哈希值,同时取得文件开头的数据。
+
+    文件开头的数据来自计算哈希值时读取的数据,只有head_size大于抽样字节数时
+    才会额外读取。
+
+    Args:
+        file_path: 文件路径。
+        algorithm: 已解析的哈希算法名称。
+        head_size: 要取得的文件开头字节数。
+        sample_size: 抽样字节数,含义与hash_file相同。
+        buffer_size: 读取缓冲区大小。
+        mmap_threshold: 不小于该大小的文件通过mmap计算哈希值,0表示不使用mmap。
+
+    Returns:
+        (文件的哈希值, 文件开头最多head_size字节的数据)。
+
+    Raises:
+        OSError: 如果读取文件失败。
+    """
+    hasher = create_hasher(algorithm)
+    head = bytearray()
+    with open(file_path, "rb", buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if sample_size > 0 and size > 2 * sample_size:
+            data = f.read(max(sample_size, head_size))
+            hasher.update(memoryview(data)[:sample_size])
+            head += data[:head_size]
+            f.seek(-sample_size, os.SEEK_END)
+            hasher.update(f.read(sample_size))
+        elif mmap_threshold > 0 and size >= mmap_threshold:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hasher.update(mapped)
+                head += mapped[:head_size]
+        else:
+            buffer = _get_buffer(buffer_size)
+            while True:
+                read_size = f.readinto(buffer)
+                if not read_size:
+                    break
+                hasher.update(buffer[:read_size])
+                if len(head) < head_size:
+                    head += buffer[: min(read_size, head_size - len(head))]
+    return hasher.hexdigest(), bytes(head)
+
+
+def copy_and_hash(
+    source_path: str,
+    target_file: BinaryIO,
+    algorithm: str,
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+) -> str:
+    """复制文件的同时计算其哈希值,源文件只读取一次。
+
+    Args:
+        source_path: 源文件路径。
+        target_file: 以二进制写模式打开的目标文件。
+        algorithm: 已解析的哈希算法名称。
+        buffer_size: 读取缓冲区大小。
+
+    Returns:
+        文件的哈希值。
+
+    Raises:
+        OSError: 如果读取或写入文件失败。
+    """
+    return copy_and_hash_with_head(
+        source_path, target_file, algorithm, 0, buffer_size
+    )[0]
+
+
+def copy_and_hash_with_head(
+    source_path: str,
+    target_file: BinaryIO,
+    algorithm: str,
+    head_size: int,
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+) -> Tuple[str, bytes]:
+    """复制文件并计算哈希值,同时取得文件开头的数据。
+
+    Args:
+        source_path: 源文件路径。
+        target_file: 以二进制写模式打开的目标文件。
+        algorithm: 已解析的哈希算法名称。
+        head_size: 要取得的文件开头字节数。
+        buffer_size: 读取缓冲区大小。
+
+    Returns:
+        (文件的哈希值, 文件开头最多head_size字节的数据)。
+
+    Raises:
+        OSError: 如果读取或写入文件失败。
+    """
+    hasher = create_hasher(algorithm)
+    buffer = _get_buffer(buffer_size)
+    head = bytearray()
+    with open(source_path, "rb", buffering=0) as f:
+        while True:
+            read_size = f.readinto(buffer)
+            if not read_size:
+                break
+            chunk = buffer[:read_size]
+            hasher.update(chunk)
+            target_file.write(chunk)
+            if len(head) < head_size:
+                head += chunk[: head_size - len(head)]
+    return hasher.hexdigest(), bytes(head)
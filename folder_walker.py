@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""文件夹遍历模块。
+
+本模块提供了基于os.scandir的文件夹遍历函数。遍历时直接保留DirEntry的stat
+结果,后续步骤无需再次获取文件信息;多个文件夹及其子文件夹可以在线程池中并行
+扫描,产生结果的顺序仍与依次使用os.walk遍历各文件夹相同。
+
+Functions:
+    walk_folders: 遍历多个文件夹,依次产生符合条件的文件及其stat信息。
+    get_entry_stat: 获取DirEntry对应文件的stat信息。
+"""
+
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+# (所在目录, 文件名, stat信息)
+WalkEntry = Tuple[str, str, os.stat_result]
+# 出错时的回调,参数为出错的路径和异常
+ErrorHandler = Callable[[str, OSError], None]
+
+
+def get_entry_stat(entry: os.DirEntry) -> os.stat_result:
+    """获取DirEntry对应文件的stat信息。
+
+    POSIX上直接使用DirEntry缓存的结果。Windows上DirEntry.stat()的st_ino和
+    st_dev始终为0,因此改用os.stat获取完整信息。
+
+    Args:
+        entry: os.scandir返回的目录项。
+
+    Returns:
+        文件的stat信息。
+
+    Raises:
+        OSError: 如果无法获取文件信息。
+    """
+    if os.name == "nt":
+        return os.stat(entry.path)
+    return entry.stat()
+
+
+def walk_folders(
+    folders: Sequence[str],
+    file_filter: Callable[[str], bool],
+    workers: int = 1,
+    on_error: Optional[ErrorHandler] = None,
+    on_folder: Optional[Callable[[], None]] = None,
+) -> Iterator[WalkEntry]:
+    """遍历多个文件夹,依次产生符合条件的文件及其stat信息。
+
+    与os.walk一样不进入指向文件夹的符号链接。workers大于1时每个文件夹的扫描
+    都是一个线程池任务,扫描完一个文件夹立即提交其子文件夹,各层级同时进行;
+    结果在调用线程中按深度优先顺序产生。调用方可以边遍历边处理结果,无需保存
+    所有结果的列表。
+
+    Args:
+        folders: 要遍历的文件夹列表。
+        file_filter: 根据文件名判断是否需要该文件的函数。
+        workers: 并行扫描的线程数。
+        on_error: 无法读取文件夹或文件信息时的回调(可选),默认忽略错误。
+        on_folder: 每得到一个文件夹的扫描结果时在调用线程中调用的函数(可选)。
+            抛出异常时停止遍历,尚未开始的扫描不再执行,异常继续向上抛出。
+
+    Yields:
+        (所在目录, 文件名, stat信息)。
+    """
+    if workers <= 1:
+        stack = list(reversed(folders))
+        while stack:
+            entries, subfolders = _scan_folder(stack.pop(), file_filter, on_error)
+            yield from entries
+            stack.extend(reversed(subfolders))
+            if on_folder is not None:
+                on_folder()
+        return
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+
+    def scan(folder: str) -> Tuple[List[WalkEntry], List[Future]]:
+        entries, subfolders = _scan_folder(folder, file_filter, on_error)
+        return entries, [executor.submit(scan, sub) for sub in subfolders]
+
+    try:
+        pending = [executor.submit(scan, folder) for folder in reversed(folders)]
+        while pending:
+            entries, children = pending.pop().result()
+            yield from entries
+            pending.extend(reversed(children))
+            if on_folder is not None:
+                on_folder()
+    finally:
+        # 正常结束时所有任务都已完成;中途停止时取消排队中的扫描
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _scan_folder(
+    folder: str, file_filter: Callable[[str], bool], on_error: Optional[ErrorHandler]
+) -> Tuple[List[WalkEntry], List[str]]:
+    """扫描单个文件夹。
+
+    Args:
+        folder: 文件夹路径。
+        file_filter: 根据文件名判断是否需要该文件的函数。
+        on_error: 出错时的回调(可选)。
+
+    Returns:
+        (符合条件的文件列表, 子文件夹路径列表)。
+    """
+    entries: List[WalkEntry] = []
+    subfolders: List[str] = []
+    try:
+        with os.scandir(folder) as iterator:
+            for entry in iterator:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    if not entry.is_symlink():
+                        subfolders.append(entry.path)
+                    continue
+                if not file_filter(entry.name):
+                    continue
+                try:
+                    entries.append((folder, entry.name, get_entry_stat(entry)))
+                except OSError as e:
+                    if on_error is not None:
+                        on_error(entry.path, e)
+    except OSError as e:
+        if on_error is not None:
+            on_error(folder, e)
+    return entries, subfolders
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""哈希值缓存模块。
+
+本模块提供了一个基于SQLite的持久化哈希值缓存,文件未发生变化时直接使用缓存的
+哈希值,无需重新读取文件。文件以(st_dev, st_ino, 大小, mtime_ns)标识,
+任何一项变化都视为新文件。
+
+同一数据库中还缓存图片信息(EXIF日期、尺寸和格式),分别以内容哈希值和文件标识
+为键。内容相同的图片无论位于哪个文件夹都无需再次解析EXIF;没有计算哈希值的图片
+(如大小唯一的图片)只要文件未变化,重新运行时也无需再次解析。
+
+Classes:
+    HashCache: 哈希值缓存类。
+"""
+
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from exception_handler import FileAccessError
+from exif_reader import ImageInfo
+
+# (st_dev, st_ino, 文件大小, mtime_ns)
+FileKey = Tuple[int, int, int, int]
+
+# 累积多少条待写入记录后提交一次事务
+FLUSH_THRESHOLD = 1000
+
+
+class HashCache:
+    """哈希值缓存类。
+
+    使用WAL模式的SQLite数据库保存哈希值,写入先在内存中累积,再批量提交事务。
+    同一文件可以缓存多种哈希值(如不同算法、抽样哈希和完整哈希),以kind区分。
+    图片信息以(哈希算法, 完整哈希值)和文件标识为键分别保存。
+
+    Attributes:
+        db_path (str): 数据库文件路径。
+    """
+
+    def __init__(self, db_path: str):
+        """初始化HashCache类。
+
+        Args:
+            db_path: 数据库文件路径,不存在时自动创建。
+
+        Raises:
+            FileAccessError: 如果无法打开数据库。
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[int, int, int, int, str, str]] = []
+        self._pending_infos: Dict[Tuple[str, str], ImageInfo] = {}
+        self._pending_file_infos: Dict[FileKey, ImageInfo] = {}
+        try:
+            self._connection = sqlite3.connect(db_path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS file_hashes (
+                    dev INTEGER NOT NULL,
+                    ino INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    PRIMARY KEY (dev, ino, size, mtime_ns, kind)
+                ) WITHOUT ROWID
+                """
+            )
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS image_infos (
+                    algorithm TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    format TEXT NOT NULL,
+                    width INTEGER,
+                    height INTEGER,
+                    exif_date TEXT,
+                    PRIMARY KEY (algorithm, digest)
+                ) WITHOUT ROWID
+                """
+            )
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS file_infos (
+                    dev INTEGER NOT NULL,
+                    ino INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    format TEXT NOT NULL,
+                    width INTEGER,
+                    height INTEGER,
+                    exif_date TEXT,
+                    PRIMARY KEY (dev, ino, size, mtime_ns)
+                ) WITHOUT ROWID
+                """
+            )
+            self._connection.commit()
+        except sqlite3.Error as e:
+            raise FileAccessError(db_path, str(e))
+
+    def get(self, key: FileKey, kind: str) -> Optional[str]:
+        """获取单个文件缓存的哈希值。
+
+        Args:
+            key: 文件标识。
+            kind: 哈希值种类。
+
+        Returns:
+            缓存的哈希值,没有缓存时返回None。
+        """
+        return self.get_many([key], kind).get(key)
+
+    def get_many(self, keys: Iterable[FileKey], kind: str) -> Dict[FileKey, str]:
+        """批量获取缓存的哈希值。
+
+        Args:
+            keys: 文件标识列表。
+            kind: 哈希值种类。
+
+        Returns:
+            有缓存的文件标识到哈希值的字典。
+        """
+        self.flush()
+        cached: Dict[FileKey, str] = {}
+        with self._lock:
+            cursor = self._connection.cursor()
+            for key in keys:
+                row = cursor.execute(
+                    "SELECT digest FROM file_hashes "
+                    "WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ? "
+                    "AND kind = ?",
+                    (*key, kind),
+                ).fetchone()
+                if row is not None:
+                    cached[key] = row[0]
+        return cached
+
+    def put(self, key: FileKey, kind: str, digest: str) -> None:
+        """缓存文件的哈希值。
+
+        记录先在内存中累积,达到阈值后批量写入。
+
+        Args:
+            key: 文件标识。
+            kind: 哈希值种类。
+            digest: 哈希值。
+        """
+        with self._lock:
+            self._pending.append((*key, kind, digest))
+            should_flush = len(self._pending) >= FLUSH_THRESHOLD
+        if should_flush:
+            self.flush()
+
+    def get_image_info(self, algorithm: str, digest: str) -> Optional[ImageInfo]:
+        """获取内容哈希值对应的图片信息。
+
+        Args:
+            algorithm: 计算哈希值使用的算法。
+            digest: 图片的完整哈希值。
+
+        Returns:
+            缓存的图片信息,没有缓存时返回None。
+        """
+        with self._lock:
+            info = self._pending_infos.get((algorithm, digest))
+            if info is not None:
+                return info
+            row = self._connection.execute(
+                "SELECT format, width, height, exif_date FROM image_infos "
+                "WHERE algorithm = ? AND digest = ?",
+                (algorithm, digest),
+            ).fetchone()
+        return _row_to_image_info(row)
+
+    def put_image_info(self, algorithm: str, digest: str, info: ImageInfo) -> None:
+        """缓存内容哈希值对应的图片信息。
+
+        Args:
+            algorithm: 计算哈希值使用的算法。
+            digest: 图片的完整哈希值。
+            info: 图片信息。
+        """
+        with self._lock:
+            self._pending_infos[(algorithm, digest)] = info
+            should_flush = len(self._pending_infos) >= FLUSH_THRESHOLD
+        if should_flush:
+            self.flush()
+
+    def get_file_info(self, key: FileKey) -> Optional[ImageInfo]:
+        """获取文件标识对应的图片信息。
+
+        Args:
+            key: 文件标识。
+
+        Returns:
+            缓存的图片信息,没有缓存时返回None。
+        """
+        with self._lock:
+            info = self._pending_file_infos.get(key)
+            if info is not None:
+                return info
+            row = self._connection.execute(
+                "SELECT format, width, height, exif_date FROM file_infos "
+                "WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ?",
+                key,
+            ).fetchone()
+        return _row_to_image_info(row)
+
+    def put_file_info(self, key: FileKey, info: ImageInfo) -> None:
+        """缓存文件标识对应的图片信息。
+
+        Args:
+            key: 文件标识。
+            info: 图片信息。
+        """
+        with self._lock:
+            self._pending_file_infos[key] = info
+            should_flush = len(self._pending_file_infos) >= FLUSH_THRESHOLD
+        if should_flush:
+            self.flush()
+
+    def flush(self) -> None:
+        """在一个事务中写入所有待写入的记录。"""
+        with self._lock:
+            if (
+                not self._pending
+                and not self._pending_infos
+                and not self._pending_file_infos
+            ):
+                return
+            pending, self._pending = self._pending, []
+            pending_infos, self._pending_infos = self._pending_infos, {}
+            pending_file_infos, self._pending_file_infos = (
+                self._pending_file_infos,
+                {},
+            )
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO file_hashes "
+                    "(dev, ino, size, mtime_ns, kind, digest) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    pending,
+                )
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO image_infos "
+                    "(algorithm, digest, format, width, height, exif_date) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        (algorithm, digest, *_image_info_to_row(info))
+                        for (algorithm, digest), info in pending_infos.items()
+                    ),
+                )
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO file_infos "
+                    "(dev, ino, size, mtime_ns, format, width, height, exif_date) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        (*key, *_image_info_to_row(info))
+                        for key, info in pending_file_infos.items()
+                    ),
+                )
+
+    def close(self) -> None:
+        """写入待写入的记录并关闭数据库。"""
+        self.flush()
+        with self._lock:
+            self._connection.close()
+
+
+def _image_info_to_row(info: ImageInfo) -> Tuple:
+    """将图片信息转换为数据库中的列值。
+
+    Args:
+        info: 图片信息。
+
+    Returns:
+        (格式, 宽度, 高度, EXIF日期字符串)。
+    """
+    exif_date = info.exif_date.isoformat() if info.exif_date else None
+    return info.format, info.width, info.height, exif_date
+
+
+def _row_to_image_info(row: Optional[Tuple]) -> Optional[ImageInfo]:
+    """将数据库中的列值转换为图片信息。
+
+    Args:
+        row: (格式, 宽度, 高度, EXIF日期字符串),没有记录时为None。
+
+    Returns:
+        图片信息,row为None时返回None。
+    """
+    if row is None:
+        return None
+    image_format, width, height, exif_date = row
+    return ImageInfo(
+        image_format,
+        width,
+        height,
+        datetime.fromisoformat(exif_date) if exif_date else None,
+    )
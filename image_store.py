@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""图片记录存储模块。
+
+本模块提供了紧凑的图片记录存储:CandidateStore保存遍历得到的候选图片,
+ImageRecordStore保存复制到目标文件夹的图片及其日期。文件夹路径只保存一次,
+每条记录只保存文件夹编号、文件名和数值字段;数值字段保存在array中,不为每张图片
+创建元组、整数和datetime对象,大量图片时占用的内存更少。
+
+Classes:
+    ImageCandidate: 待处理的候选图片。
+    CandidateStore: 候选图片存储类。
+    ImageRecordStore: 图片记录存储类。
+"""
+
+import os
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple
+
+from hash_cache import FileKey
+
+# 日期以距该时间的微秒数保存。不经过本地时区换算,夏令时切换时也不会改变日期
+_EPOCH = datetime(1970, 1, 1)
+
+
+class ImageCandidate(NamedTuple):
+    """待处理的候选图片。
+
+    Attributes:
+        root: 文件所在目录。
+        file: 文件名。
+        size: 文件大小(字节)。
+        mtime_ns: 文件修改时间(纳秒)。
+        dev: 文件所在设备号。
+        ino: 文件的inode号。
+        in_target: 是否为目标文件夹中已有的图片。
+    """
+
+    root: str
+    file: str
+    size: int
+    mtime_ns: int
+    dev: int
+    ino: int
+    in_target: bool = False
+
+    @classmethod
+    def from_stat(
+        cls, root: str, file: str, stat: os.stat_result, in_target: bool = False
+    ) -> "ImageCandidate":
+        """根据文件的stat信息创建候选图片。
+
+        Args:
+            root: 文件所在目录。
+            file: 文件名。
+            stat: 文件的stat信息。
+            in_target: 是否为目标文件夹中已有的图片。
+
+        Returns:
+            候选图片。
+        """
+        return cls(
+            root,
+            file,
+            stat.st_size,
+            stat.st_mtime_ns,
+            stat.st_dev,
+            stat.st_ino,
+            in_target,
+        )
+
+    @property
+    def path(self) -> str:
+        """文件路径。"""
+        return os.path.join(self.root, self.file)
+
+    @property
+    def key(self) -> FileKey:
+        """哈希值缓存使用的文件标识。"""
+        return (self.dev, self.ino, self.size, self.mtime_ns)
+
+
+class CandidateStore:
+    """候选图片存储类。
+
+    候选图片按添加顺序编号,编号从0开始。文件名以文件系统编码依次存放在一个
+    bytearray中,访问时才生成ImageCandidate。
+    """
+
+    __slots__ = (
+        "_folders",
+        "_folder_ids",
+        "_folder_indexes",
+        "_names",
+        "_name_ends",
+        "_sizes",
+        "_mtimes",
+        "_devs",
+        "_inos",
+        "_in_target",
+    )
+
+    def __init__(self):
+        """初始化CandidateStore类。"""
+        self._folders: List[str] = []
+        self._folder_ids: Dict[str, int] = {}
+        self._folder_indexes = array("I")
+        self._names = bytearray()
+        self._name_ends = array("Q")
+        self._sizes = array("q")
+        self._mtimes = array("q")
+        self._devs = array("Q")
+        self._inos = array("Q")
+        self._in_target = bytearray()
+
+    def __len__(self) -> int:
+        """获取候选图片数。
+
+        Returns:
+            候选图片数。
+        """
+        return len(self._sizes)
+
+    def __getitem__(self, index: int) -> ImageCandidate:
+        """获取候选图片。
+
+        Args:
+            index: 候选图片编号。
+
+        Returns:
+            候选图片。
+        """
+        start = self._name_ends[index - 1] if index > 0 else 0
+        return ImageCandidate(
+            self._folders[self._folder_indexes[index]],
+            os.fsdecode(bytes(self._names[start : self._name_ends[index]])),
+            self._sizes[index],
+            self._mtimes[index],
+            self._devs[index],
+            self._inos[index],
+            bool(self._in_target[index]),
+        )
+
+    def __iter__(self) -> Iterator[ImageCandidate]:
+        """依次获取所有候选图片。
+
+        Yields:
+            候选图片。
+        """
+        for index in range(len(self)):
+            yield self[index]
+
+    def append(
+        self, root: str, file: str, stat: os.stat_result, in_target: bool = False
+    ) -> None:
+        """根据文件的stat信息添加候选图片。
+
+        Args:
+            root: 文件所在目录。
+            file: 文件名。
+            stat: 文件的stat信息。
+            in_target: 是否为目标文件夹中已有的图片。
+        """
+        folder_id = self._folder_ids.get(root)
+        if folder_id is None:
+            folder_id = self._folder_ids[root] = len(self._folders)
+            self._folders.append(root)
+        self._folder_indexes.append(folder_id)
+        self._names += os.fsencode(file)
+        self._name_ends.append(len(self._names))
+        self._sizes.append(stat.st_size)
+        self._mtimes.append(stat.st_mtime_ns)
+        self._devs.append(stat.st_dev)
+        self._inos.append(stat.st_ino)
+        self._in_target.append(in_target)
+
+    def size(self, index: int) -> int:
+        """获取候选图片的文件大小。
+
+        Args:
+            index: 候选图片编号。
+
+        Returns:
+            文件大小(字节)。
+        """
+        return self._sizes[index]
+
+    def is_in_target(self, index: int) -> bool:
+        """判断候选图片是否为目标文件夹中已有的图片。
+
+        Args:
+            index: 候选图片编号。
+
+        Returns:
+            是目标文件夹中已有的图片时返回True。
+        """
+        return bool(self._in_target[index])
+
+    def sizes(self) -> Iterator[int]:
+        """依次获取所有候选图片的文件大小。
+
+        Returns:
+            文件大小迭代器。
+        """
+        return iter(self._sizes)
+
+
+class ImageRecordStore:
+    """图片记录存储类。
+
+    记录按添加顺序编号,编号从0开始。
+    """
+
+    __slots__ = ("_folders", "_folder_ids", "_folder_indexes", "_names", "_dates")
+
+    def __init__(self, image_dates: Iterable[Tuple[str, datetime]] = ()):
+        """初始化ImageRecordStore类。
+
+        Args:
+            image_dates: 初始的(图片路径, 图片日期)记录(可选)。
+        """
+        self._folders: List[str] = []
+        self._folder_ids: Dict[str, int] = {}
+        self._folder_indexes = array("I")
+        self._names: List[str] = []
+        self._dates = array("q")
+        for path, date in image_dates:
+            self.append(path, date)
+
+    def __len__(self) -> int:
+        """获取记录数。
+
+        Returns:
+            记录数。
+        """
+        return len(self._names)
+
+    def append(self, path: str, date: datetime) -> None:
+        """添加一条记录。
+
+        Args:
+            path: 图片路径。
+            date: 图片日期。
+        """
+        folder, name = os.path.split(path)
+        folder_id = self._folder_ids.get(folder)
+        if folder_id is None:
+            folder_id = self._folder_ids[folder] = len(self._folders)
+            self._folders.append(folder)
+        self._folder_indexes.append(folder_id)
+        self._names.append(name)
+        self._dates.append((date - _EPOCH) // timedelta(microseconds=1))
+
+    def path(self, index: int) -> str:
+        """获取记录的图片路径。
+
+        Args:
+            index: 记录编号。
+
+        Returns:
+            图片路径。
+        """
+        folder = self._folders[self._folder_indexes[index]]
+        return os.path.join(folder, self._names[index])
+
+    def name(self, index: int) -> str:
+        """获取记录的文件名。
+
+        Args:
+            index: 记录编号。
+
+        Returns:
+            文件名。
+        """
+        return self._names[index]
+
+    def date(self, index: int) -> datetime:
+        """获取记录的图片日期。
+
+        Args:
+            index: 记录编号。
+
+        Returns:
+            图片日期。
+        """
+        return _EPOCH + timedelta(microseconds=self._dates[index])
+
+    def names(self) -> Iterator[str]:
+        """依次获取所有记录的文件名。
+
+        Returns:
+            文件名迭代器。
+        """
+        return iter(self._names)
+
+    def indexes_by_date(self) -> List[int]:
+        """获取按日期排序的记录编号。
+
+        排序是稳定的,日期相同的记录保持添加顺序。
+
+        Returns:
+            记录编号列表。
+        """
+        return sorted(range(len(self._dates)), key=self._dates.__getitem__)
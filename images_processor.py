@@ -6,23 +6,124 @@ Classes:
     ImageProcessor: 图片处理器类。
 """
 
+import asyncio
 import os
 import re
 import shutil
-import hashlib
+import tempfile
+import threading
+from collections import Counter, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Tuple, Dict, Optional
+from functools import partial
+from itertools import repeat
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Tuple,
+    Dict,
+    Optional,
+    NamedTuple,
+    Sequence,
+    Set,
+    Union,
+)
 from PIL import Image
 import piexif
 
+from batch_dedup import find_first_occurrences, numpy_available
+from digest_set import DigestIndex, DigestList, DigestSpool
+from hash_cache import FileKey, HashCache
+from image_store import CandidateStore, ImageCandidate, ImageRecordStore
+from exif_reader import (
+    EXIF_DATE_FORMAT,
+    HEADER_SIZE,
+    ImageInfo,
+    parse_image_info,
+    read_exif_date,
+)
+from file_copier import LINK_MODES, link_or_copy_file
+from folder_walker import get_entry_stat, walk_folders
+from name_allocator import NameAllocator
+from pipeline import iter_chunks, run_in_background
+from file_hasher import (
+    DEFAULT_BUFFER_SIZE,
+    DEFAULT_MMAP_THRESHOLD,
+    copy_and_hash_with_head,
+    create_hasher,
+    hash_file,
+    hash_file_with_head,
+    resolve_algorithm,
+)
 from exception_handler import (
     ImageRenameError,
     ImageCopyError,
     HashCalculationError,
     FileAccessError,
+    ProcessingCancelledError,
 )
 
 
+# 分级哈希时头部和尾部各抽样的字节数
+SAMPLE_SIZE = 64 * 1024
+# 并行执行时每批任务包含的最大文件数
+BATCH_SIZE = 256
+# 支持的并行执行方式
+EXECUTOR_TYPES = ("thread", "process")
+# 支持的图片日期来源
+DATE_SOURCES = ("exif", "filename", "mtime")
+# 流水线相邻阶段之间的队列最多缓存的图片数
+PIPELINE_QUEUE_SIZE = 1024
+# 目标文件夹中保存已收集图片哈希值的索引文件名
+TARGET_INDEX_NAME = ".image_index.sqlite3"
+# 文件名为随机字母和数字组合的图片添加的前缀
+RANDOM_NAME_PREFIX = "疑似网图"
+# 重命名后的文件名格式:序号_日期_时间.扩展名
+RENAMED_NAME_PATTERN = re.compile(r"^(\d{4,})_\d{8}_\d{6}\.")
+# 去重时候选图片的哈希值状态:无需按哈希值去重、已有完整哈希值、推迟到复制时计算、
+# 计算失败(跳过该图片)
+DIGEST_NONE = 0
+DIGEST_READY = 1
+DIGEST_DEFERRED = 2
+DIGEST_FAILED = 3
+
+
+class CollectedImage(NamedTuple):
+    """复制到目标文件夹的图片。
+
+    Attributes:
+        path: 目标文件路径。
+        mtime_ns: 文件修改时间(纳秒),未知时为None。复制时保留了源文件的修改
+            时间,与源文件相同。
+        info: 收集时从文件开头解析出的图片信息,没有时为None。
+        key: 源文件的文件标识,用于缓存获取日期时读取的图片信息,未知时为None。
+    """
+
+    path: str
+    mtime_ns: Optional[int] = None
+    info: Optional[ImageInfo] = None
+    key: Optional[FileKey] = None
+
+
+class ProgressEvent(NamedTuple):
+    """后台收集阶段产生的进度事件,由调用线程转发给观察者。
+
+    Attributes:
+        event: 事件名称。
+        data: 事件相关数据。
+    """
+
+    event: str
+    data: Any = None
+
+
 class ImageProcessor:
     """图片处理器类。
 
@@ -32,13 +133,124 @@ class ImageProcessor:
         source_folders (List[str]): 源文件夹列表。
         target_folder (str): 目标文件夹路径。
         observers (List): 观察者列表。
+        hash_algorithm (str): 去重使用的哈希算法。
+        buffer_size (int): 计算哈希值时的读取缓冲区大小。
+        mmap_threshold (int): 通过mmap计算哈希值的文件大小阈值。
+        workers (int): 并行处理的线程数或进程数。
+        date_workers (int): 并行获取图片日期的线程数或进程数。
+        dedup_memory_limit (int): 去重时内存中最多保存的哈希值数,0表示不限制。
+        executor (str): 并行执行方式,thread或process。
+        hash_cache (Optional[HashCache]): 持久化的哈希值缓存。
+        hash_on_copy (bool): 是否在复制的同时计算完整哈希值。
+        link_mode (str): 在目标文件夹中创建图片的方式。
+        date_sources (Tuple[str, ...]): 获取图片日期时依次尝试的来源。
     """
 
-    def __init__(self):
-        """初始化ImageProcessor类。"""
+    def __init__(
+        self,
+        hash_algorithm: str = "md5",
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        mmap_threshold: int = DEFAULT_MMAP_THRESHOLD,
+        workers: int = 1,
+        executor: str = "thread",
+        cache_path: Optional[str] = None,
+        hash_on_copy: bool = False,
+        link_mode: str = "copy",
+        date_sources: Sequence[str] = DATE_SOURCES,
+        date_workers: Optional[int] = None,
+        dedup_memory_limit: int = 0,
+    ):
+        """初始化ImageProcessor类。
+
+        Args:
+            hash_algorithm: 去重使用的哈希算法,如md5、sha256、blake2b,
+                以及安装了对应库时可用的xxh3_128、blake3。
+            buffer_size: 计算哈希值时的读取缓冲区大小,默认1MB。
+            mmap_threshold: 不小于该大小的文件通过mmap计算哈希值,0表示不使用mmap。
+            workers: 并行处理的线程数或进程数,1表示在当前线程中依次处理。
+            executor: 并行执行方式。thread使用线程池,适合释放GIL的哈希计算和I/O;
+                process使用进程池,适合纯Python哈希和EXIF解析等CPU密集的工作。
+            cache_path: 哈希值缓存数据库的路径(可选)。设置后未变化的文件直接使用
+                上次运行缓存的哈希值,内容相同的图片直接使用缓存的EXIF日期等图片
+                信息。
+            hash_on_copy: 是否在复制的同时计算完整哈希值。开启后需要完整哈希值去重
+                的图片只读取一次:先边读取边写入目标文件夹的临时文件,确认不重复后
+                再原子地重命名为目标文件,重复则删除临时文件。适合源磁盘较慢的情况。
+                只在link_mode为copy时生效。
+            link_mode: 在目标文件夹中创建图片的方式。copy复制文件;hardlink创建
+                硬链接;reflink通过FICLONE创建共享数据块的克隆;symlink创建指向源
+                文件的符号链接。这三种方式无法使用时(如跨文件系统)回退为复制。
+                move移动文件并移除源文件:与目标文件夹在同一设备上时直接重命名,
+                否则复制并校验后再删除源文件。重复的图片保留在源文件夹中。
+            date_sources: 获取图片日期时依次尝试的来源,exif、filename或mtime,
+                得到日期后不再尝试后面的来源。例如("filename", "exif", "mtime")
+                时文件名中带有时间的图片不会被打开。所有来源都没有日期时使用文件
+                修改时间。
+            date_workers: 并行获取图片日期的线程数或进程数,默认与workers相同。
+                获取日期与收集、复制同时进行,可以单独设置。
+            dedup_memory_limit: 去重时内存中最多保存的哈希值数,0表示不限制。
+                超过后转存到目标文件夹中的临时数据库,内存中只保留布隆过滤器,
+                适合图片数量超出内存的情况。设置后不使用NumPy批量去重。
+
+        Raises:
+            ValueError: 如果并行执行方式、创建方式或日期来源不受支持,或读取缓冲区
+                大小、mmap阈值无效。
+            FileAccessError: 如果无法打开哈希值缓存数据库。
+        """
+        if executor not in EXECUTOR_TYPES:
+            raise ValueError(f"不支持的并行执行方式: {executor}")
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"不支持的创建方式: {link_mode}")
+        for date_source in date_sources:
+            if date_source not in DATE_SOURCES:
+                raise ValueError(f"不支持的日期来源: {date_source}")
+        if buffer_size <= 0:
+            raise ValueError(f"读取缓冲区大小必须大于0: {buffer_size}")
+        if mmap_threshold < 0:
+            raise ValueError(f"mmap阈值不能小于0: {mmap_threshold}")
         self.source_folders: List[str] = []
         self.target_folder: str = ""
         self.observers: List = []
+        self.hash_algorithm: str = resolve_algorithm(hash_algorithm)
+        self.buffer_size: int = buffer_size
+        self.mmap_threshold: int = mmap_threshold
+        self.workers: int = max(1, workers)
+        self.executor: str = executor
+        self.hash_cache: Optional[HashCache] = (
+            HashCache(cache_path) if cache_path else None
+        )
+        self.hash_on_copy: bool = hash_on_copy
+        self.link_mode: str = link_mode
+        self.date_sources: Tuple[str, ...] = tuple(date_sources)
+        self.date_workers: int = (
+            self.workers if date_workers is None else max(1, date_workers)
+        )
+        self.dedup_memory_limit: int = max(0, dedup_memory_limit)
+        self._target_index: Optional[HashCache] = None
+        self._name_allocator: Optional[NameAllocator] = None
+        self._executor_pools: Dict[int, Executor] = {}
+        self._cancel_event: Optional[threading.Event] = None
+        self._image_infos: Dict[str, ImageInfo] = {}
+
+    def __getstate__(self) -> Dict:
+        """获取用于序列化的状态。
+
+        进程池执行时会将ImageProcessor传给子进程,观察者(如GUI)、哈希值缓存、
+        目标文件夹索引、文件名分配器、执行器和取消事件无法序列化,子进程也不需要
+        它们,因此不包含在内。
+
+        Returns:
+            对象状态字典。
+        """
+        state = self.__dict__.copy()
+        state["observers"] = []
+        state["hash_cache"] = None
+        state["_target_index"] = None
+        state["_name_allocator"] = None
+        state["_executor_pools"] = {}
+        state["_cancel_event"] = None
+        state["_image_infos"] = {}
+        return state
 
     def add_observer(self, observer: object) -> None:
         """添加观察者。
@@ -98,43 +310,275 @@ class ImageProcessor:
     def process_images(self) -> None:
         """处理图片。
 
-        收集、去重和重命名图片。
+        收集、去重和重命名图片。各阶段以流水线方式运行:收集、去重和复制在后台
+        线程中进行,每复制一张图片就通过有界队列交给获取日期的阶段,两者同时进行。
+        重命名需要按日期排序,在所有图片的日期获取完成后进行。观察者只在调用线程
+        中收到通知:计算哈希值时每完成一批收到一次images_hashed通知,之后每处理完
+        一批图片收到一次images_collected通知。
+
+        处理中途出错或取消时,本次已复制到目标文件夹的图片仍会先重命名,再抛出
+        异常,以免之后的运行把它们当作目标文件夹中已有的图片而不再编号。
+
+        Raises:
+            ValueError: 如果没有设置源文件夹或目标文件夹。
+        """
+        self._process_images(threading.Event())
+
+    async def process_images_async(self) -> AsyncIterator[Tuple[str, Any]]:
+        """在事件循环中处理图片,逐个产生处理进度事件。
+
+        处理过程在线程池中运行,不阻塞事件循环。事件与观察者收到的相同,为
+        (事件名称, 事件相关数据),最后一个事件为processing_completed。此期间
+        其他观察者在工作线程中收到通知。
+
+        取消正在迭代的任务或提前停止迭代时,收集在当前图片完成后停止,本次已复制
+        的图片重命名后工作线程退出,期间等待工作线程。已开始的重命名阶段会完成,
+        以免序号不连续。
+
+        Yields:
+            (事件名称, 事件相关数据)。
+
+        Raises:
+            ValueError: 如果没有设置源文件夹或目标文件夹。
+        """
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        observer = _AsyncEventObserver(loop, events)
+        cancel_event = threading.Event()
+        self.add_observer(observer)
+        task = loop.run_in_executor(None, self._process_images, cancel_event)
+        next_event: Optional[asyncio.Future] = None
+        try:
+            while True:
+                next_event = asyncio.ensure_future(events.get())
+                done, _ = await asyncio.wait(
+                    {next_event, task}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if next_event in done:
+                    yield next_event.result()
+                    continue
+                next_event.cancel()
+                # 工作线程结束前发出的事件都已在队列中
+                while not events.empty():
+                    yield events.get_nowait()
+                task.result()
+                return
+        finally:
+            if next_event is not None:
+                next_event.cancel()
+            if not task.done():
+                cancel_event.set()
+                await asyncio.wait({task})
+                if not task.cancelled():
+                    task.exception()
+            self.remove_observer(observer)
+
+    def _process_images(self, cancel_event: threading.Event) -> None:
+        """处理图片,cancel_event被设置时停止。
+
+        Args:
+            cancel_event: 取消事件。
 
         Raises:
             ValueError: 如果没有设置源文件夹或目标文件夹。
+            ProcessingCancelledError: 如果处理已取消。
         """
         if not self.source_folders:
             raise ValueError("请至少添加一个源文件夹")
         if not self.target_folder:
             raise ValueError("请选择目标文件夹")
 
-        collected_images = self._collect_and_deduplicate_images()
-        self._rename_images(collected_images)
+        self._cancel_event = cancel_event
+        try:
+            with self._executor_pool_scope(self.workers), self._executor_pool_scope(
+                self.date_workers
+            ):
+                self._collect_and_rename_images()
+        finally:
+            self._cancel_event = None
         self.notify_observers("processing_completed")
 
-    def _get_image_date(self, file_path: str) -> datetime:
+    def _collect_and_rename_images(self) -> None:
+        """以流水线方式收集、去重图片并获取日期,然后按日期重命名。
+
+        Raises:
+            ProcessingCancelledError: 如果处理已取消。
+        """
+        # 已复制到目标文件夹、尚未得到日期的图片,按复制顺序排列
+        pending: Deque[CollectedImage] = deque()
+        collected_images = run_in_background(
+            self._track_pending_images(self._iter_collected_images(), pending),
+            PIPELINE_QUEUE_SIZE,
+        )
+        image_dates = ImageRecordStore()
+        try:
+            images = self._forward_progress_events(collected_images)
+            for path, date in self._iter_image_dates(images):
+                image_dates.append(path, date)
+                pending.popleft()
+                if len(image_dates) % BATCH_SIZE == 0:
+                    self.notify_observers("images_collected", len(image_dates))
+            self._check_cancelled()
+        except BaseException:
+            # 先停止后台的收集阶段,之后pending中不会再加入图片
+            collected_images.close()
+            self._rename_after_abort(image_dates, pending)
+            raise
+        self.notify_observers("collection_completed", len(image_dates))
+        self._rename_dated_images(image_dates)
+
+    def _forward_progress_events(
+        self, items: Iterable[Union[CollectedImage, ProgressEvent]]
+    ) -> Iterator[CollectedImage]:
+        """在当前线程中将收集阶段的进度事件转发给观察者,只产生图片。
+
+        Args:
+            items: _iter_collected_images产生的图片和进度事件。
+
+        Yields:
+            复制到目标文件夹的图片。
+        """
+        for item in items:
+            if isinstance(item, ProgressEvent):
+                self.notify_observers(item.event, item.data)
+            else:
+                yield item
+
+    def _track_pending_images(
+        self,
+        items: Iterable[Union[CollectedImage, ProgressEvent]],
+        pending: Deque[CollectedImage],
+    ) -> Iterator[Union[CollectedImage, ProgressEvent]]:
+        """产生图片前先将其加入pending,记录已复制到目标文件夹的图片。
+
+        Args:
+            items: _iter_collected_images产生的图片和进度事件。
+            pending: 已复制、尚未得到日期的图片队列。
+
+        Yields:
+            items中的图片和进度事件。
+        """
+        for item in items:
+            if not isinstance(item, ProgressEvent):
+                pending.append(item)
+            yield item
+
+    def _rename_after_abort(
+        self, image_dates: ImageRecordStore, pending: Iterable[CollectedImage]
+    ) -> None:
+        """处理中止时重命名本次已复制到目标文件夹的图片。
+
+        尚未得到日期的图片在当前线程中逐个获取日期。重命名也失败时打印错误,
+        由调用方继续抛出原来的异常。
+
+        Args:
+            image_dates: 已得到日期的图片记录。
+            pending: 已复制、尚未得到日期的图片。
+        """
+        try:
+            for image in pending:
+                date = self._get_image_date(image.path, image.info, image.mtime_ns)
+                image_dates.append(image.path, date)
+            if len(image_dates):
+                self._rename_dated_images(image_dates)
+        except Exception as e:
+            print(f"中止处理时重命名已复制的图片出错: {e}")
+
+    def _check_cancelled(self) -> None:
+        """检查处理是否已取消。
+
+        Raises:
+            ProcessingCancelledError: 如果处理已取消。
+        """
+        if self._cancel_event is not None and self._cancel_event.is_set():
+            raise ProcessingCancelledError()
+
+    def _get_image_date(
+        self,
+        file_path: str,
+        info: Optional[ImageInfo] = None,
+        mtime_ns: Optional[int] = None,
+    ) -> datetime:
         """获取图片日期。
 
-        首先尝试从EXIF数据获取日期,如果失败则从文件名或修改时间获取。
+        按date_sources的顺序从EXIF数据、文件名或修改时间获取日期,得到日期后
+        不再尝试后面的来源。提供了收集时解析出的图片信息和修改时间时,不再打开
+        文件。
 
         Args:
             file_path: 图片文件路径。
+            info: 收集时从文件开头解析出的图片信息(可选)。
+            mtime_ns: 文件修改时间(纳秒,可选)。
 
         Returns:
             图片的日期时间。
         """
-        # 尝试从EXIF数据获取日期
+        return self._get_image_date_and_info(file_path, info, mtime_ns)[0]
+
+    def _get_image_date_and_info(
+        self,
+        file_path: str,
+        info: Optional[ImageInfo] = None,
+        mtime_ns: Optional[int] = None,
+    ) -> Tuple[datetime, Optional[ImageInfo]]:
+        """获取图片日期,同时返回为此从文件开头读取的图片信息。
+
+        没有提供图片信息、又需要EXIF日期时,先读取文件开头解析图片信息;无法
+        解析时再使用完整的EXIF解析。
+
+        Args:
+            file_path: 图片文件路径。
+            info: 收集时从文件开头解析出的图片信息(可选)。
+            mtime_ns: 文件修改时间(纳秒,可选)。
+
+        Returns:
+            (图片的日期时间, 本次读取的图片信息),没有读取文件开头或无法解析时
+            图片信息为None。
+        """
+        read_info: Optional[ImageInfo] = None
+        for date_source in self.date_sources:
+            if date_source == "exif":
+                if info is None:
+                    info = read_info = self._read_image_info(file_path)
+                if info is not None:
+                    date = info.exif_date
+                else:
+                    date = self._get_exif_date(file_path)
+            elif date_source == "filename":
+                date = self._get_filename_date(file_path)
+            else:
+                date = self._get_mtime_date(file_path, mtime_ns)
+            if date is not None:
+                return date, read_info
+
+        # 如果上述方法都失败,则使用文件修改时间
+        return self._get_mtime_date(file_path, mtime_ns), read_info
+
+    def _read_image_info(self, file_path: str) -> Optional[ImageInfo]:
+        """读取文件开头并解析图片信息。
+
+        Args:
+            file_path: 图片文件路径。
+
+        Returns:
+            图片信息,无法读取或解析时返回None。
+        """
         try:
-            with Image.open(file_path) as img:
-                exif_data = img._getexif()
-                if exif_data:
-                    exif = piexif.load(img.info["exif"])
-                    date_time = exif["0th"][piexif.ImageIFD.DateTime].decode("utf-8")
-                    return datetime.strptime(date_time, "%Y:%m:%d %H:%M:%S")
-        except Exception:
-            pass
+            with open(file_path, "rb") as f:
+                head = f.read(HEADER_SIZE)
+        except OSError:
+            return None
+        return parse_image_info(head)
 
-        # 尝试从文件名获取日期
+    def _get_filename_date(self, file_path: str) -> Optional[datetime]:
+        """从文件名获取日期。
+
+        Args:
+            file_path: 图片文件路径。
+
+        Returns:
+            文件名中的日期时间,没有时返回None。
+        """
         file_name = os.path.basename(file_path)
         date_pattern = (
             r"(\d{4})[-_]?(\d{2})[-_]?(\d{2})[-_]?(\d{2})[-_]?(\d{2})[-_]?(\d{2})"
@@ -146,57 +590,762 @@ class ImageProcessor:
                 return datetime(*date_parts)
             except ValueError:
                 pass
+        return None
 
-        # 如果上述方法都失败,则使用文件修改时间
+    def _get_mtime_date(self, file_path: str, mtime_ns: Optional[int]) -> datetime:
+        """从文件修改时间获取日期。
+
+        Args:
+            file_path: 图片文件路径。
+            mtime_ns: 已知的文件修改时间(纳秒),为None时读取文件信息。
+
+        Returns:
+            文件修改时间。
+        """
+        if mtime_ns is not None:
+            return datetime.fromtimestamp(mtime_ns / 1e9)
         return datetime.fromtimestamp(os.path.getmtime(file_path))
 
-    def _get_file_hash(self, file_path: str) -> str:
-        """获取文件的MD5哈希值。
+    def _get_exif_date(self, file_path: str) -> Optional[datetime]:
+        """从EXIF数据获取日期。
+
+        JPEG文件直接从文件头的APP1段读取日期,不解码图片;其他格式或文件头无法
+        解析时使用Pillow和piexif解析。
+
+        Args:
+            file_path: 图片文件路径。
+
+        Returns:
+            DateTimeOriginal或DateTime中的日期,没有时返回None。
+        """
+        try:
+            return read_exif_date(file_path)
+        except ValueError:
+            pass
+        except OSError:
+            return None
+
+        try:
+            with Image.open(file_path) as img:
+                exif_data = img._getexif()
+                if exif_data:
+                    exif = piexif.load(img.info["exif"])
+                    date_time = exif["Exif"].get(
+                        piexif.ExifIFD.DateTimeOriginal,
+                        exif["0th"].get(piexif.ImageIFD.DateTime),
+                    )
+                    return datetime.strptime(
+                        date_time.decode("utf-8"), EXIF_DATE_FORMAT
+                    )
+        except Exception:
+            pass
+        return None
+
+    def _get_file_hash(self, file_path: str, sample_size: int = 0) -> str:
+        """获取文件的哈希值。
 
         Args:
             file_path: 文件路径。
+            sample_size: 抽样字节数。大于0时只计算文件头部和尾部各sample_size字节的
+                哈希值;文件不大于2*sample_size时与完整哈希值相同。
 
         Returns:
-            文件的MD5哈希值。
+            文件的哈希值。
         """
         try:
-            hash_md5 = hashlib.md5()
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_md5.update(chunk)
-            return hash_md5.hexdigest()
+            return hash_file(
+                file_path,
+                self.hash_algorithm,
+                sample_size,
+                self.buffer_size,
+                self.mmap_threshold,
+            )
         except Exception as e:
             raise HashCalculationError(file_path, str(e))
 
+    def _get_file_hash_and_info(
+        self, file_path: str, sample_size: int = 0
+    ) -> Tuple[str, Optional[ImageInfo]]:
+        """获取文件的哈希值,同时从读取的文件开头数据中解析图片信息。
+
+        Args:
+            file_path: 文件路径。
+            sample_size: 抽样字节数,含义与_get_file_hash相同。
+
+        Returns:
+            (文件的哈希值, 图片信息),无法从文件开头解析图片信息时图片信息为None。
+        """
+        try:
+            file_hash, head = hash_file_with_head(
+                file_path,
+                self.hash_algorithm,
+                HEADER_SIZE,
+                sample_size,
+                self.buffer_size,
+                self.mmap_threshold,
+            )
+        except Exception as e:
+            raise HashCalculationError(file_path, str(e))
+        return file_hash, parse_image_info(head)
+
     def _collect_and_deduplicate_images(self) -> List[str]:
         """收集并去重图片。
 
         Returns:
             去重后的图片路径列表。
         """
-        collected_images: List[str] = []
-        hash_dict: Dict[str, str] = {}
-
-        for folder in self.source_folders:
-            self._process_folder(folder, collected_images, hash_dict)
-
+        collected_images = [
+            image.path
+            for image in self._forward_progress_events(self._iter_collected_images())
+        ]
         self.notify_observers("collection_completed", len(collected_images))
         return collected_images
 
-    def _process_folder(
-        self, folder: str, collected_images: List[str], hash_dict: Dict[str, str]
-    ) -> None:
-        """处理单个文件夹中的图片。
+    def _iter_collected_images(
+        self,
+    ) -> Iterator[Union[CollectedImage, ProgressEvent]]:
+        """收集并去重图片,每复制一张图片就产生一个结果。
+
+        目标文件夹中已有的图片也参与去重,内容已存在于目标文件夹的图片不会再次
+        复制。目标文件夹中图片的哈希值保存在目标文件夹的索引中,重复运行时无需
+        重新计算。计算哈希值时读取过的图片同时解析出图片信息,获取日期时无需再
+        打开文件。安装了NumPy或设置了去重内存上限时,已有完整哈希值的图片先批量
+        去重,重复的图片直接跳过;没有推迟到复制时计算哈希值的图片时,完全按批量
+        去重的结果复制,不再逐个查询已收集图片的哈希值集合。
+
+        遍历时每扫描一个文件夹、计算哈希值时每完成一批检查一次是否已取消。
+
+        Yields:
+            复制到目标文件夹的图片,以及每计算完一批哈希值产生的images_hashed
+            进度事件,数据为(本轮已计算数, 本轮总数)。
+        """
+        seen_hashes: Optional[DigestIndex] = None
+        digests: Optional[Union[DigestList, DigestSpool]] = None
+
+        self._target_index = self._open_target_index()
+        try:
+            # 候选图片保存在紧凑的数组中,目标文件夹中的图片排在源图片之前
+            candidates = CandidateStore()
+            self._scan_target_folder(candidates)
+            self._collect_source_candidates(candidates)
+            self._check_cancelled()
+
+            digests = self._create_digest_list()
+            states = yield from self._iter_dedup_hashes(candidates, digests)
+            # 可以批量去重、且没有复制时才计算哈希值的图片时,无需逐个去重
+            bulk_only = self._can_find_first_occurrences(digests) and (
+                DIGEST_DEFERRED not in states
+            )
+            if not bulk_only:
+                # 已收集图片的哈希值,以二进制形式紧凑保存,超过内存上限时转存到磁盘
+                seen_hashes = DigestIndex(
+                    digests.digest_size,
+                    self.dedup_memory_limit,
+                    self.target_folder,
+                    len(digests),
+                )
+            # 第一次出现的图片未能复制时,其哈希值留给之后内容相同的图片
+            unclaimed_hashes: Set[bytes] = set()
+            entries = self._iter_dedup_entries(candidates, states, digests)
+            for candidate, digest, hash_on_copy, is_first in entries:
+                self._check_cancelled()
+                if candidate.in_target:
+                    if digest is not None and seen_hashes is not None:
+                        seen_hashes.add(digest)
+                    continue
+                if not is_first and digest not in unclaimed_hashes:
+                    self._image_infos.pop(candidate.path, None)
+                    continue
+                target_path = self._process_image_file(
+                    candidate, digest, seen_hashes, hash_on_copy
+                )
+                if digest is not None:
+                    if target_path is None:
+                        unclaimed_hashes.add(digest)
+                    else:
+                        unclaimed_hashes.discard(digest)
+                info = self._image_infos.pop(candidate.path, None)
+                if target_path is not None:
+                    if info is None and digest is not None:
+                        info = self._get_cached_image_info(digest.hex())
+                    if info is None:
+                        info = self._get_cached_file_info(candidate.key)
+                    yield CollectedImage(
+                        target_path, candidate.mtime_ns, info, candidate.key
+                    )
+        finally:
+            if seen_hashes is not None:
+                seen_hashes.close()
+            if digests is not None:
+                digests.close()
+            self._image_infos.clear()
+            if self.hash_cache is not None:
+                self.hash_cache.flush()
+            if self._target_index is not None:
+                self._target_index.close()
+                self._target_index = None
+            self._name_allocator = None
+
+    def _create_digest_list(self) -> Union[DigestList, DigestSpool]:
+        """创建保存候选图片完整哈希值的列表。
+
+        设置了去重内存上限时哈希值保存在目标文件夹中的临时数据库里,否则紧凑地
+        保存在内存中。
+
+        Returns:
+            空的哈希值列表。
+
+        Raises:
+            FileAccessError: 如果无法创建临时数据库。
+        """
+        digest_size = len(create_hasher(self.hash_algorithm).digest())
+        if self.dedup_memory_limit:
+            return DigestSpool(digest_size, self.dedup_memory_limit, self.target_folder)
+        return DigestList(digest_size)
+
+    def _can_find_first_occurrences(
+        self, digests: Union[DigestList, DigestSpool]
+    ) -> bool:
+        """判断能否批量判断完整哈希值是否第一次出现。
+
+        Args:
+            digests: _iter_dedup_hashes得到的完整哈希值列表。
+
+        Returns:
+            哈希值保存在磁盘上或安装了NumPy时返回True。
+        """
+        return isinstance(digests, DigestSpool) or numpy_available()
+
+    def _iter_first_occurrences(
+        self, digests: Union[DigestList, DigestSpool]
+    ) -> Iterator[Tuple[bytes, bool]]:
+        """按顺序依次获取完整哈希值及其是否第一次出现。
+
+        目标文件夹中的图片排在源图片之前,源图片的哈希值只有不在目标文件夹中、
+        且在源图片中第一次出现时才是第一次出现。哈希值保存在磁盘上时由SQLite
+        判断,保存在内存中时用NumPy批量判断。
+
+        Args:
+            digests: _iter_dedup_hashes得到的完整哈希值列表。
+
+        Yields:
+            (二进制哈希值, 是否第一次出现)。没有安装NumPy、无法批量判断时都视为
+            第一次出现,由复制时逐个去重。
+        """
+        if isinstance(digests, DigestSpool):
+            return digests.iter_first_occurrences()
+        if not numpy_available():
+            return zip(digests, repeat(True))
+        first_flags = find_first_occurrences(digests.getbuffer(), digests.digest_size)
+        return zip(digests, map(bool, first_flags))
+
+    def _iter_dedup_entries(
+        self,
+        candidates: CandidateStore,
+        states: bytearray,
+        digests: Union[DigestList, DigestSpool],
+    ) -> Iterator[Tuple[ImageCandidate, Optional[bytes], bool, bool]]:
+        """按顺序依次产生候选图片及其去重所需的信息。
+
+        Args:
+            candidates: 候选图片存储。
+            states: _iter_dedup_hashes得到的哈希值状态。
+            digests: _iter_dedup_hashes得到的完整哈希值列表。
+
+        Yields:
+            (候选图片, 二进制完整哈希值, 是否在复制时计算哈希值, 哈希值是否第一次
+            出现)。没有完整哈希值的图片哈希值为None,视为第一次出现;哈希值计算
+            失败的图片不产生结果。
+        """
+        first_occurrences = self._iter_first_occurrences(digests)
+        for index, state in enumerate(states):
+            if state == DIGEST_FAILED:
+                continue
+            digest: Optional[bytes] = None
+            is_first = True
+            if state == DIGEST_READY:
+                digest, is_first = next(first_occurrences)
+            yield candidates[index], digest, state == DIGEST_DEFERRED, is_first
+
+    def _iter_dedup_hashes(
+        self, candidates: CandidateStore, digests: Union[DigestList, DigestSpool]
+    ) -> Generator[ProgressEvent, None, bytearray]:
+        """计算候选图片去重所需的哈希值,计算过程中产生进度事件。
+
+        去重分级进行:大小唯一的图片不可能与其他图片重复;大小相同的图片再比较头部
+        和尾部的抽样哈希值;只有抽样哈希值也相同的图片才计算完整哈希值。只在目标
+        文件夹的图片之间发生的碰撞无需处理。哈希值可以并行计算,结果仍按候选图片
+        的顺序排列,去重结果与串行处理相同。开启hash_on_copy时,没有缓存的源图片
+        的完整哈希值推迟到复制时计算。
+
+        Args:
+            candidates: 候选图片存储。
+            digests: 空的哈希值列表,按顺序写入状态为DIGEST_READY的图片的二进制
+                完整哈希值。哈希值在这里转换为二进制,之后的去重不再使用十六进制
+                字符串。
+
+        Returns:
+            哈希值状态,每个候选图片一个字节的DIGEST_*值。
+        """
+        size_counts = Counter(candidates.sizes())
+        target_size_counts = Counter(
+            candidates.size(index)
+            for index in range(len(candidates))
+            if candidates.is_in_target(index)
+        )
+        # 大小相同、且其中至少有一张源图片的图片才需要比较抽样哈希值
+        sample_indexes = [
+            index
+            for index, size in enumerate(candidates.sizes())
+            if size_counts[size] > max(1, target_size_counts[size])
+        ]
+        sample_hashes = yield from self._iter_file_hashes(
+            [candidates[index] for index in sample_indexes], SAMPLE_SIZE
+        )
+        sample_keys = {
+            index: (candidates.size(index), sample_hash)
+            for index, sample_hash in zip(sample_indexes, sample_hashes)
+            if sample_hash is not None
+        }
+        sample_counts = Counter(sample_keys.values())
+        source_samples = {
+            key
+            for index, key in sample_keys.items()
+            if not candidates.is_in_target(index)
+        }
+        colliding = {
+            index
+            for index, key in sample_keys.items()
+            if sample_counts[key] > 1 and key in source_samples
+        }
+
+        # 文件不大于两倍抽样大小时,抽样哈希值即完整哈希值
+        hash_indexes = sorted(
+            index for index in colliding if candidates.size(index) > 2 * SAMPLE_SIZE
+        )
+        deferred: Set[int] = set()
+        if self.hash_on_copy and self.link_mode == "copy":
+            source_indexes = [
+                index for index in hash_indexes if not candidates.is_in_target(index)
+            ]
+            cached_hashes = self._get_cached_hashes(
+                [candidates[index] for index in source_indexes]
+            )
+            deferred = {
+                index
+                for index, file_hash in zip(source_indexes, cached_hashes)
+                if file_hash is None
+            }
+            hash_indexes = [index for index in hash_indexes if index not in deferred]
+        full_hashes = yield from self._iter_file_hashes(
+            [candidates[index] for index in hash_indexes]
+        )
+        file_hashes = dict(zip(hash_indexes, full_hashes))
+
+        states = bytearray(len(candidates))
+        for index in sample_indexes:
+            if index not in sample_keys:
+                states[index] = DIGEST_FAILED
+                continue
+            if candidates.size(index) <= 2 * SAMPLE_SIZE:
+                file_hash = sample_keys[index][1]
+            elif index in deferred:
+                states[index] = DIGEST_DEFERRED
+                continue
+            elif index in file_hashes:
+                file_hash = file_hashes[index]
+                if file_hash is None:
+                    states[index] = DIGEST_FAILED
+                    continue
+            else:
+                continue
+            states[index] = DIGEST_READY
+            digests.append(bytes.fromhex(file_hash))
+        return states
+
+    def _iter_file_hashes(
+        self, candidates: Sequence[ImageCandidate], sample_size: int = 0
+    ) -> Generator[ProgressEvent, None, List[Optional[str]]]:
+        """计算多个候选图片的哈希值,每计算完一批产生一个进度事件。
+
+        设置了哈希值缓存时,未变化的文件直接使用缓存的哈希值,其余文件的哈希值
+        计算后写入缓存。目标文件夹中的图片使用目标文件夹索引作为缓存。
+        workers大于1时并行计算,结果顺序与候选图片顺序一致。
+
+        计算哈希值时从文件开头解析出的源图片信息保存在_image_infos中。
+
+        Args:
+            candidates: 候选图片列表。
+            sample_size: 抽样字节数,0表示计算完整哈希值。
+
+        Yields:
+            images_hashed进度事件,数据为(已计算数, 需要计算的总数)。
+
+        Returns:
+            哈希值列表,计算失败的图片对应None。
+
+        Raises:
+            ProcessingCancelledError: 如果处理已取消。
+        """
+        kind = self._get_hash_kind(sample_size)
+        file_hashes = self._get_cached_hashes(candidates, sample_size)
+        missing = [
+            index for index, file_hash in enumerate(file_hashes) if file_hash is None
+        ]
+        paths = [candidates[index].path for index in missing]
+        batches = self._iter_batches(
+            partial(self._get_file_hashes_batch, sample_size=sample_size), paths
+        )
+
+        missing_indexes = iter(missing)
+        hashed = 0
+        for batch in batches:
+            # 先从batch中取值,batch用完时不会多取走一个missing_indexes
+            for result, index in zip(batch, missing_indexes):
+                if result is None:
+                    continue
+                candidate = candidates[index]
+                file_hash, info = result
+                file_hashes[index] = file_hash
+                if info is not None and not candidate.in_target:
+                    self._image_infos[candidate.path] = info
+                    self._put_cached_file_info(candidate.key, info)
+                    # 抽样哈希值只有在文件不大于两倍抽样大小时才是内容哈希值
+                    if sample_size == 0 or candidate.size <= 2 * sample_size:
+                        self._put_cached_image_info(file_hash, info)
+                cache = self._get_hash_cache_for(candidate)
+                if cache is not None:
+                    cache.put(candidate.key, kind, file_hash)
+            hashed += len(batch)
+            yield ProgressEvent("images_hashed", (hashed, len(paths)))
+        for cache in (self.hash_cache, self._target_index):
+            if cache is not None:
+                cache.flush()
+        return file_hashes
+
+    def _get_cached_hashes(
+        self, candidates: Sequence[ImageCandidate], sample_size: int = 0
+    ) -> List[Optional[str]]:
+        """获取多个候选图片缓存的哈希值。
 
         Args:
-            folder: 要处理的文件夹路径。
-            collected_images: 收集的图片列表。
-            hash_dict: 用于去重的哈希字典。
+            candidates: 候选图片列表。
+            sample_size: 抽样字节数,0表示完整哈希值。
+
+        Returns:
+            哈希值列表,没有缓存的图片对应None。
         """
-        for root, _, files in os.walk(folder):
-            for file in files:
-                if self._is_image_file(file):
-                    self._process_image_file(root, file, collected_images, hash_dict)
+        kind = self._get_hash_kind(sample_size)
+        file_hashes: List[Optional[str]] = [None] * len(candidates)
+        for cache, in_target in ((self.hash_cache, False), (self._target_index, True)):
+            if cache is None:
+                continue
+            cached = cache.get_many(
+                (c.key for c in candidates if c.in_target == in_target), kind
+            )
+            for index, candidate in enumerate(candidates):
+                if candidate.in_target == in_target:
+                    file_hashes[index] = cached.get(candidate.key)
+        return file_hashes
+
+    def _get_cached_image_info(self, file_hash: str) -> Optional[ImageInfo]:
+        """获取哈希值缓存中内容哈希值对应的图片信息。
+
+        Args:
+            file_hash: 图片的完整哈希值。
+
+        Returns:
+            缓存的图片信息,没有设置哈希值缓存或没有缓存时返回None。
+        """
+        if self.hash_cache is None:
+            return None
+        return self.hash_cache.get_image_info(self.hash_algorithm, file_hash)
+
+    def _put_cached_image_info(self, file_hash: str, info: ImageInfo) -> None:
+        """将图片信息以内容哈希值为键写入哈希值缓存。
+
+        Args:
+            file_hash: 图片的完整哈希值。
+            info: 图片信息。
+        """
+        if self.hash_cache is not None:
+            self.hash_cache.put_image_info(self.hash_algorithm, file_hash, info)
+
+    def _get_cached_file_info(self, key: FileKey) -> Optional[ImageInfo]:
+        """获取哈希值缓存中文件标识对应的图片信息。
+
+        Args:
+            key: 源文件的文件标识。
+
+        Returns:
+            缓存的图片信息,没有设置哈希值缓存或没有缓存时返回None。
+        """
+        if self.hash_cache is None:
+            return None
+        return self.hash_cache.get_file_info(key)
+
+    def _put_cached_file_info(self, key: FileKey, info: ImageInfo) -> None:
+        """将图片信息以文件标识为键写入哈希值缓存。
+
+        没有计算哈希值的图片(如大小唯一的图片)也可以通过文件标识命中缓存。
+
+        Args:
+            key: 源文件的文件标识。
+            info: 图片信息。
+        """
+        if self.hash_cache is not None:
+            self.hash_cache.put_file_info(key, info)
+
+    def _get_hash_cache_for(self, candidate: ImageCandidate) -> Optional[HashCache]:
+        """获取候选图片使用的哈希值缓存。
+
+        Args:
+            candidate: 候选图片。
+
+        Returns:
+            目标文件夹中的图片返回目标文件夹索引,其余返回哈希值缓存。
+        """
+        return self._target_index if candidate.in_target else self.hash_cache
+
+    def _get_hash_kind(self, sample_size: int = 0) -> str:
+        """获取哈希值缓存中区分哈希值种类的字符串。
+
+        Args:
+            sample_size: 抽样字节数,0表示完整哈希值。
+
+        Returns:
+            由哈希算法和抽样字节数组成的字符串。
+        """
+        return f"{self.hash_algorithm}:{sample_size}"
+
+    def _get_file_hashes_batch(
+        self, file_paths: List[str], sample_size: int = 0
+    ) -> List[Optional[Tuple[str, Optional[ImageInfo]]]]:
+        """计算一批文件的哈希值和图片信息,作为并行执行的任务单元。
+
+        Args:
+            file_paths: 文件路径列表。
+            sample_size: 抽样字节数,0表示计算完整哈希值。
+
+        Returns:
+            (哈希值, 图片信息)列表,计算失败的文件对应None。
+        """
+        return [
+            self._try_get_file_hash_and_info(path, sample_size) for path in file_paths
+        ]
+
+    def _map_batches(
+        self,
+        func: Callable[[List], List],
+        items: List,
+        workers: Optional[int] = None,
+    ) -> List:
+        """将列表分批并行处理。
+
+        workers大于1时按executor在线程池或进程池中执行,每个任务处理一批数据并返回
+        一个结果列表,避免逐个文件传递消息。结果顺序与输入顺序一致。
+
+        Args:
+            func: 处理一批数据并返回等长结果列表的函数。进程池执行时必须可序列化。
+            items: 要处理的数据列表。
+            workers: 并行数,默认为self.workers。
+
+        Returns:
+            结果列表。
+
+        Raises:
+            ProcessingCancelledError: 如果处理已取消。
+        """
+        results: List = []
+        for batch_results in self._iter_batches(func, items, workers):
+            results.extend(batch_results)
+        return results
+
+    def _iter_batches(
+        self,
+        func: Callable[[List], List],
+        items: List,
+        workers: Optional[int] = None,
+    ) -> Iterator[List]:
+        """将列表分批并行处理,按输入顺序依次产生每批的结果。
+
+        每产生一批结果后检查一次是否已取消,取消时尚未开始的批次不再执行。
+        workers为1时在当前线程中逐批处理。
+
+        Args:
+            func: 处理一批数据并返回等长结果列表的函数。进程池执行时必须可序列化。
+            items: 要处理的数据列表。
+            workers: 并行数,默认为self.workers。
+
+        Yields:
+            每批的结果列表。
+
+        Raises:
+            ProcessingCancelledError: 如果处理已取消。
+        """
+        if workers is None:
+            workers = self.workers
+        if workers == 1 or len(items) < 2:
+            for start in range(0, len(items), BATCH_SIZE):
+                yield func(items[start : start + BATCH_SIZE])
+                self._check_cancelled()
+            return
+
+        batch_size = min(BATCH_SIZE, -(-len(items) // workers))
+        with self._executor_pool_scope(workers):
+            executor_pool = self._executor_pools[workers]
+            futures = [
+                executor_pool.submit(func, items[start : start + batch_size])
+                for start in range(0, len(items), batch_size)
+            ]
+            try:
+                for future in futures:
+                    yield future.result()
+                    self._check_cancelled()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    @contextmanager
+    def _executor_pool_scope(self, workers: int) -> Iterator[None]:
+        """在作用域内创建并复用指定并行数的线程池或进程池。
+
+        已有相同并行数的执行器时直接复用,一次处理过程中的各阶段共享执行器,
+        避免反复创建进程池。workers为1时不创建执行器。
+
+        Args:
+            workers: 并行数。
+        """
+        if workers == 1 or workers in self._executor_pools:
+            yield
+            return
+
+        executor_class = (
+            ProcessPoolExecutor if self.executor == "process" else ThreadPoolExecutor
+        )
+        with executor_class(max_workers=workers) as executor_pool:
+            self._executor_pools[workers] = executor_pool
+            try:
+                yield
+            finally:
+                del self._executor_pools[workers]
+
+    def _try_get_file_hash_and_info(
+        self, file_path: str, sample_size: int = 0
+    ) -> Optional[Tuple[str, Optional[ImageInfo]]]:
+        """获取文件的哈希值和图片信息,出错时打印错误并返回None。
+
+        Args:
+            file_path: 文件路径。
+            sample_size: 抽样字节数,0表示计算完整哈希值。
+
+        Returns:
+            (文件的哈希值, 图片信息),计算失败时返回None。
+        """
+        file = os.path.basename(file_path)
+        try:
+            return self._get_file_hash_and_info(file_path, sample_size)
+        except HashCalculationError as e:
+            print(f"处理文件 {file} 的哈希出错: {e}")
+        except FileAccessError as e:
+            print(f"处理文件 {file} 的文件访问出错: {e}")
+        return None
+
+    def _open_target_index(self) -> Optional[HashCache]:
+        """打开目标文件夹的哈希值索引。
+
+        Returns:
+            目标文件夹索引,无法打开时返回None(不影响去重结果,只是需要重新计算
+            目标文件夹中图片的哈希值)。
+        """
+        if not os.path.isdir(self.target_folder):
+            return None
+        try:
+            return HashCache(os.path.join(self.target_folder, TARGET_INDEX_NAME))
+        except FileAccessError as e:
+            print(f"打开目标文件夹索引出错: {e}")
+            return None
+
+    def _scan_target_folder(self, candidates: CandidateStore) -> None:
+        """将目标文件夹中已有的图片添加到候选图片存储。
+
+        同时用扫描到的所有文件名初始化目标文件名分配器,之后分配文件名时无需再
+        检查文件是否存在。
+
+        Args:
+            candidates: 候选图片存储。
+        """
+        if not os.path.isdir(self.target_folder):
+            return
+
+        names: List[str] = []
+        with os.scandir(self.target_folder) as entries:
+            for entry in entries:
+                names.append(entry.name)
+                if not entry.is_file() or not self._is_image_file(entry.name):
+                    continue
+                try:
+                    stat = get_entry_stat(entry)
+                except OSError as e:
+                    self._report_access_error(entry.path, e)
+                    continue
+                candidates.append(self.target_folder, entry.name, stat, in_target=True)
+        self._name_allocator = NameAllocator(self.target_folder, names)
+
+    def _add_to_target_index(self, target_path: str, digest: bytes) -> None:
+        """将复制到目标文件夹的图片的哈希值写入目标文件夹索引。
+
+        Args:
+            target_path: 目标文件路径。
+            digest: 文件的二进制完整哈希值。
+        """
+        if self._target_index is None:
+            return
+        file_hash = digest.hex()
+        try:
+            stat = os.stat(target_path)
+        except OSError:
+            return
+        key = ImageCandidate.from_stat(self.target_folder, "", stat).key
+        self._target_index.put(key, self._get_hash_kind(), file_hash)
+        # 文件不大于两倍抽样大小时,抽样哈希值即完整哈希值
+        if stat.st_size <= 2 * SAMPLE_SIZE:
+            self._target_index.put(key, self._get_hash_kind(SAMPLE_SIZE), file_hash)
+
+    def _collect_source_candidates(self, candidates: CandidateStore) -> None:
+        """将所有源文件夹中的候选图片添加到候选图片存储。
+
+        使用os.scandir遍历并保留遍历时得到的stat信息,遍历结果直接写入存储,不
+        保存中间列表。workers大于1时各源文件夹及其子文件夹在线程池中并行扫描,
+        结果顺序与依次遍历各源文件夹相同。每扫描一个文件夹检查一次是否已取消。
+
+        Args:
+            candidates: 候选图片存储。
+
+        Raises:
+            ProcessingCancelledError: 如果处理已取消。
+        """
+        entries = walk_folders(
+            self.source_folders,
+            self._is_image_file,
+            self.workers,
+            self._report_access_error,
+            self._check_cancelled,
+        )
+        for root, file, stat in entries:
+            candidates.append(root, file, stat)
+
+    def _report_access_error(self, path: str, error: OSError) -> None:
+        """打印遍历文件夹时的文件访问错误。
+
+        Args:
+            path: 出错的路径。
+            error: 异常。
+        """
+        print(
+            f"处理文件 {os.path.basename(path)} 的文件访问出错: "
+            f"{FileAccessError(path, str(error))}"
+        )
 
     def _is_image_file(self, file: str) -> bool:
         """检查文件是否为图片。
@@ -212,52 +1361,55 @@ class ImageProcessor:
 
     def _process_image_file(
         self,
-        root: str,
-        file: str,
-        collected_images: List[str],
-        hash_dict: Dict[str, str],
-    ) -> None:
+        candidate: ImageCandidate,
+        digest: Optional[bytes],
+        seen_hashes: Optional[DigestIndex],
+        hash_on_copy: bool = False,
+    ) -> Optional[str]:
         """处理单个图片文件。
 
         Args:
-            root: 文件所在的根目录。
-            file: 文件名。
-            collected_images: 收集的图片列表。
-            hash_dict: 用于去重的哈希字典。
-        """
-        source_path = os.path.join(root, file)
-        try:
-            file_hash = self._get_file_hash(source_path)
-        except HashCalculationError as e:
-            print(f"处理文件 {file} 的哈希出错: {e}")
-            return
-        except FileAccessError as e:
-            print(f"处理文件 {file} 的文件访问出错: {e}")
-            return
+            candidate: 候选图片。
+            digest: 图片的二进制完整哈希值,无需按哈希值去重时为None。
+            seen_hashes: 已收集图片的哈希值集合,已批量去重、无需逐个去重时为None。
+                hash_on_copy为True时不能为None。
+            hash_on_copy: 是否在复制的同时计算完整哈希值去重。
 
-        if file_hash not in hash_dict:
-            self._copy_unique_image(
-                source_path, file, collected_images, hash_dict, file_hash
-            )
+        Returns:
+            复制到目标文件夹的路径,图片重复或源文件无法读取时返回None。
+        """
+        if hash_on_copy:
+            return self._copy_image_if_unique(candidate, seen_hashes)
+        if seen_hashes is None:
+            return self._copy_unique_image(candidate.path, candidate.file, digest)
+        # add同时判断哈希值是否已存在,只查询一次集合
+        if digest is not None and not seen_hashes.add(digest):
+            return None
+
+        target_path = self._copy_unique_image(candidate.path, candidate.file, digest)
+        if target_path is None and digest is not None:
+            # 源文件无法读取时撤销,之后内容相同的图片仍可收集
+            seen_hashes.discard(digest)
+        return target_path
 
     def _get_unique_target_path(self, file: str) -> str:
         """获取唯一的目标文件路径。
 
-        如果目标路径已存在,则在文件名后添加计数器。
+        如果目标路径已存在,则在文件名后添加计数器。分配的路径会创建空文件预留,
+        调用方应覆盖写入,失败时删除。
 
         Args:
             file: 原始文件名。
 
         Returns:
             唯一的目标文件路径。
+
+        Raises:
+            OSError: 如果无法在目标文件夹中预留文件。
         """
-        target_path = os.path.join(self.target_folder, file)
-        counter = 1
-        while os.path.exists(target_path):
-            name, ext = os.path.splitext(file)
-            target_path = os.path.join(self.target_folder, f"{name}_{counter}{ext}")
-            counter += 1
-        return target_path
+        if self._name_allocator is None:
+            self._name_allocator = NameAllocator(self.target_folder)
+        return self._name_allocator.allocate(file)
 
     def _rename_images(self, image_files: List[str]) -> None:
         """重命名图片。
@@ -265,14 +1417,52 @@ class ImageProcessor:
         Args:
             image_files: 要重命名的图片文件路径列表。
         """
-        image_dates: List[Tuple[str, datetime]] = [
-            (f, self._get_image_date(f)) for f in image_files
-        ]
-        image_dates.sort(key=lambda x: x[1])
+        images = (CollectedImage(path) for path in image_files)
+        self._rename_dated_images(ImageRecordStore(self._iter_image_dates(images)))
+
+    def _iter_image_dates(
+        self, images: Iterable[CollectedImage]
+    ) -> Iterator[Tuple[str, datetime]]:
+        """逐块获取图片的日期。
+
+        每次从images中取出一块图片,以date_workers的并行数获取日期,前一阶段仍在
+        产生图片时即可开始处理。结果顺序与images的顺序一致。获取日期时读取的
+        图片信息以源文件的文件标识为键写入哈希值缓存,重新运行时无需再打开文件。
+
+        Args:
+            images: 复制到目标文件夹的图片的可迭代对象。
+
+        Yields:
+            (图片路径, 图片日期)。
+        """
+        try:
+            for chunk in iter_chunks(images, BATCH_SIZE * self.date_workers):
+                self._check_cancelled()
+                results = self._map_batches(
+                    self._get_image_dates_batch, chunk, self.date_workers
+                )
+                for image, (date, info) in zip(chunk, results):
+                    if info is not None and image.key is not None:
+                        self._put_cached_file_info(image.key, info)
+                    yield image.path, date
+        finally:
+            if self.hash_cache is not None:
+                self.hash_cache.flush()
+
+    def _rename_dated_images(self, image_dates: ImageRecordStore) -> None:
+        """按日期顺序重命名图片。
+
+        序号接在目标文件夹中已有图片的最大序号之后,重复运行时不会覆盖上次运行
+        重命名的图片。
 
-        for index, (old_path, date) in enumerate(image_dates, start=1):
-            old_name = os.path.basename(old_path)
-            time_str = self._get_time_string(old_name, date)
+        Args:
+            image_dates: 图片及其日期的记录。
+        """
+        start = self._get_next_sequence_number(image_dates.names())
+        for index, record in enumerate(image_dates.indexes_by_date(), start=start):
+            old_path = image_dates.path(record)
+            old_name = image_dates.name(record)
+            time_str = self._get_time_string(old_name, image_dates.date(record))
             new_name = f"{index:04d}_{time_str}{os.path.splitext(old_name)[1]}"
             new_path = os.path.join(self.target_folder, new_name)
 
@@ -281,7 +1471,44 @@ class ImageProcessor:
             except Exception as e:
                 raise ImageRenameError(old_path, new_path, str(e))
 
-        self.notify_observers("renaming_completed", len(image_files))
+        self.notify_observers("renaming_completed", len(image_dates))
+
+    def _get_next_sequence_number(self, image_files: Iterable[str]) -> int:
+        """获取重命名使用的起始序号。
+
+        Args:
+            image_files: 本次要重命名的图片文件名或路径,不参与序号统计。
+
+        Returns:
+            目标文件夹中已重命名图片的最大序号加1。只统计符合本工具重命名格式
+            的文件名,如20200315_143000.jpg这样以数字开头的其他文件名不计入。
+        """
+        excluded = {os.path.basename(f) for f in image_files}
+        last_number = 0
+        with os.scandir(self.target_folder) as entries:
+            for entry in entries:
+                if entry.name in excluded or not self._is_image_file(entry.name):
+                    continue
+                match = RENAMED_NAME_PATTERN.match(entry.name)
+                if match:
+                    last_number = max(last_number, int(match.group(1)))
+        return last_number + 1
+
+    def _get_image_dates_batch(
+        self, images: List[CollectedImage]
+    ) -> List[Tuple[datetime, Optional[ImageInfo]]]:
+        """获取一批图片的日期,作为并行执行的任务单元。
+
+        Args:
+            images: 复制到目标文件夹的图片列表。
+
+        Returns:
+            (图片日期, 本次读取的图片信息)列表,含义与_get_image_date_and_info相同。
+        """
+        return [
+            self._get_image_date_and_info(image.path, image.info, image.mtime_ns)
+            for image in images
+        ]
 
     def _get_time_string(self, file_name: str, date: datetime) -> str:
         """获取时间字符串。
@@ -299,35 +1526,161 @@ class ImageProcessor:
         return time_info.group(0) if time_info else date.strftime("%Y%m%d_%H%M%S")
 
     def _copy_unique_image(
-        self,
-        source_path: str,
-        file: str,
-        collected_images: List[str],
-        hash_dict: Dict[str, str],
-        file_hash: str,
-    ) -> None:
+        self, source_path: str, file: str, digest: Optional[bytes]
+    ) -> Optional[str]:
         """复制唯一的图片到目标文件夹，并添加前缀。
 
+        源文件无法读取时打印错误并跳过该图片。
+
         Args:
             source_path: 源文件路径。
             file: 文件名。
-            collected_images: 收集的图片列表。
-            hash_dict: 用于去重的哈希字典。
-            file_hash: 文件的哈希值。
+            digest: 文件的二进制哈希值,未计算哈希值时为None。
+
+        Returns:
+            目标文件路径,源文件无法读取时返回None。
+
+        Raises:
+            ImageCopyError: 如果无法写入目标文件夹。
         """
-        target_path = self._get_unique_target_path(file)
-        if self._is_random_name(file):
-            target_path = self.add_prefix_to_image(source_path, self.target_folder)
+        try:
+            target_path = self._get_target_path(file)
+        except OSError as e:
+            raise ImageCopyError(source_path, self.target_folder, str(e))
 
         try:
-            shutil.copy2(source_path, target_path)
-            collected_images.append(target_path)
-            hash_dict[file_hash] = target_path
-        except ImageCopyError as e:
+            link_or_copy_file(
+                source_path, target_path, self.link_mode, self.buffer_size
+            )
+        except OSError as e:
+            self._discard_target_path(target_path)
+            if self._is_source_unreadable(source_path):
+                self._report_access_error(source_path, e)
+                return None
             raise ImageCopyError(source_path, target_path, str(e))
 
+        if digest is not None:
+            self._add_to_target_index(target_path, digest)
+        return target_path
+
+    def _copy_image_if_unique(
+        self,
+        candidate: ImageCandidate,
+        seen_hashes: DigestIndex,
+    ) -> Optional[str]:
+        """边复制边计算哈希值,图片不重复时才保留复制结果。
+
+        源文件只读取一次:内容写入目标文件夹中的临时文件,同时计算完整哈希值。
+        哈希值已存在时删除临时文件,否则复制文件元数据后原子地重命名为目标文件。
+        源文件无法读取时打印错误并跳过该图片。
+
+        Args:
+            candidate: 候选图片。
+            seen_hashes: 已收集图片的哈希值集合。
+
+        Returns:
+            目标文件路径,图片重复或源文件无法读取时返回None。
+
+        Raises:
+            ImageCopyError: 如果无法写入目标文件夹。
+        """
+        source_path = candidate.path
+        # 本图片加入seen_hashes的哈希值,源文件无法读取时撤销
+        added_digest: Optional[bytes] = None
+        fd, temp_path = tempfile.mkstemp(
+            suffix=".part", prefix=".", dir=self.target_folder
+        )
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                file_hash, head = copy_and_hash_with_head(
+                    source_path,
+                    temp_file,
+                    self.hash_algorithm,
+                    HEADER_SIZE,
+                    self.buffer_size,
+                )
+            info = parse_image_info(head)
+            if info is not None:
+                self._image_infos[candidate.path] = info
+                self._put_cached_image_info(file_hash, info)
+                self._put_cached_file_info(candidate.key, info)
+            digest = bytes.fromhex(file_hash)
+            if not seen_hashes.add(digest):
+                os.remove(temp_path)
+                return None
+            added_digest = digest
+            shutil.copystat(source_path, temp_path)
+            target_path = self._get_target_path(candidate.file)
+            try:
+                os.replace(temp_path, target_path)
+            except OSError:
+                self._discard_target_path(target_path)
+                raise
+        except OSError as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if self._is_source_unreadable(source_path):
+                if added_digest is not None:
+                    seen_hashes.discard(added_digest)
+                self._report_access_error(source_path, e)
+                return None
+            raise ImageCopyError(source_path, self.target_folder, str(e))
+
+        self._add_to_target_index(target_path, digest)
+        if self.hash_cache is not None:
+            self.hash_cache.put(candidate.key, self._get_hash_kind(), file_hash)
+        return target_path
+
+    def _get_target_path(self, file: str) -> str:
+        """获取并预留图片复制到目标文件夹的路径。
+
+        文件名为随机字母和数字组合的图片添加前缀。
+
+        Args:
+            file: 文件名。
+
+        Returns:
+            目标文件路径。
+
+        Raises:
+            OSError: 如果无法在目标文件夹中预留文件。
+        """
+        if self._is_random_name(file):
+            file = f"{RANDOM_NAME_PREFIX}_{file}"
+        return self._get_unique_target_path(file)
+
+    def _is_source_unreadable(self, source_path: str) -> bool:
+        """检查源文件是否无法读取,用于区分复制失败出在源文件还是目标文件夹。
+
+        源文件的错误只影响该图片,可以跳过;目标文件夹的错误会影响之后的所有
+        图片,应中止处理。
+
+        Args:
+            source_path: 源文件路径。
+
+        Returns:
+            源文件无法打开或读取时返回True。
+        """
+        try:
+            with open(source_path, "rb") as source:
+                source.read(1)
+        except OSError:
+            return True
+        return False
+
+    def _discard_target_path(self, target_path: str) -> None:
+        """删除复制失败时预留或写入了部分内容的目标文件。
+
+        Args:
+            target_path: 目标文件路径。
+        """
+        try:
+            os.remove(target_path)
+        except OSError:
+            pass
+
     def add_prefix_to_image(
-        self, file_path: str, target_folder: str, prefix: str = "疑似网图"
+        self, file_path: str, target_folder: str, prefix: str = RANDOM_NAME_PREFIX
     ) -> str:
         """为文件名为随机字母和数字组合的图片添加前缀。
 
@@ -355,3 +1708,26 @@ class ImageProcessor:
             如果文件名是随机字母和数字组合则返回True，否则返回False。
         """
         return re.match(r"^[a-zA-Z0-9]+$", os.path.splitext(file_name)[0]) is not None
+
+
+class _AsyncEventObserver:
+    """将观察者通知转发到事件循环中的队列。"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, events: asyncio.Queue):
+        """初始化_AsyncEventObserver类。
+
+        Args:
+            loop: 事件循环。
+            events: 接收事件的队列。
+        """
+        self.loop = loop
+        self.events = events
+
+    def update(self, event: str, data: Optional[object] = None) -> None:
+        """在任意线程中接收通知,放入事件循环中的队列。
+
+        Args:
+            event: 事件名称。
+            data: 事件相关数据(可选)。
+        """
+        self.loop.call_soon_threadsafe(self.events.put_nowait, (event, data))
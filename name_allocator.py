@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""目标文件名分配模块。
+
+本模块提供了一个NameAllocator类,为复制到目标文件夹的图片分配不重复的文件名。
+已存在的文件名只在创建时通过一次os.scandir获取,之后在内存中记录每个文件名
+下一个可用的计数器,分配时不再逐个检查文件是否存在。分配的文件名通过O_EXCL
+创建空文件预留,即使有其他程序同时写入目标文件夹也不会覆盖已有文件。
+
+Classes:
+    NameAllocator: 目标文件名分配器。
+"""
+
+import os
+import threading
+from typing import Dict, Iterable, Optional, Set
+
+
+class NameAllocator:
+    """目标文件名分配器。
+
+    文件名已存在时,在文件名后添加计数器,如photo.jpg、photo_1.jpg、photo_2.jpg。
+
+    Attributes:
+        folder (str): 目标文件夹路径。
+    """
+
+    def __init__(self, folder: str, existing_names: Optional[Iterable[str]] = None):
+        """初始化NameAllocator类。
+
+        Args:
+            folder: 目标文件夹路径。
+            existing_names: 目标文件夹中已有的文件名。为None时扫描目标文件夹获取。
+        """
+        self.folder = folder
+        if existing_names is None:
+            existing_names = self._scan_names(folder)
+        self._taken: Set[str] = {os.path.normcase(name) for name in existing_names}
+        self._next_counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _scan_names(folder: str) -> Iterable[str]:
+        """获取文件夹中已有的文件名。
+
+        Args:
+            folder: 文件夹路径。
+
+        Returns:
+            文件名列表,文件夹不存在时为空。
+        """
+        if not os.path.isdir(folder):
+            return []
+        with os.scandir(folder) as entries:
+            return [entry.name for entry in entries]
+
+    def allocate(self, file: str) -> str:
+        """分配并预留一个不重复的目标文件路径。
+
+        Args:
+            file: 期望的文件名。
+
+        Returns:
+            已预留的目标文件路径,对应一个新创建的空文件,调用方应覆盖写入。
+
+        Raises:
+            OSError: 如果无法在目标文件夹中创建文件。
+        """
+        name, ext = os.path.splitext(file)
+        stem_key = os.path.normcase(file)
+        with self._lock:
+            counter = self._next_counters.get(stem_key, 0)
+            while True:
+                candidate = file if counter == 0 else f"{name}_{counter}{ext}"
+                counter += 1
+                if os.path.normcase(candidate) in self._taken:
+                    continue
+                self._taken.add(os.path.normcase(candidate))
+                if self._reserve(candidate):
+                    self._next_counters[stem_key] = counter
+                    return os.path.join(self.folder, candidate)
+
+    def _reserve(self, file: str) -> bool:
+        """通过O_EXCL创建空文件预留文件名。
+
+        Args:
+            file: 文件名。
+
+        Returns:
+            预留成功返回True,文件已被其他程序创建时返回False。
+
+        Raises:
+            OSError: 如果创建文件时出现其他错误。
+        """
+        try:
+            fd = os.open(
+                os.path.join(self.folder, file),
+                os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, "O_BINARY", 0),
+            )
+        except FileExistsError:
+            return False
+        os.close(fd)
+        return True
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""流水线模块。
+
+本模块提供了连接图片处理各阶段的辅助函数。前一阶段在后台线程中运行,结果通过
+有界队列交给后一阶段,两个阶段可以同时进行,队列中缓存的数据量也不会超过上限。
+
+Functions:
+    run_in_background: 在后台线程中迭代,通过有界队列返回结果。
+    iter_chunks: 将可迭代对象按固定大小分块。
+"""
+
+import queue
+import threading
+from itertools import islice
+from typing import Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+# 后台线程等待队列空位时检查是否需要停止的间隔(秒)
+_PUT_TIMEOUT = 0.1
+
+_ITEM = 0
+_DONE = 1
+_ERROR = 2
+
+
+def run_in_background(iterable: Iterable[T], maxsize: int) -> Iterator[T]:
+    """在后台线程中迭代iterable,通过有界队列把结果交给调用方。
+
+    队列满时后台线程等待调用方取走数据。后台线程中的异常会在调用方重新抛出;
+    调用方提前停止迭代时,后台线程在放入下一项时停止,并关闭iterable。
+
+    Args:
+        iterable: 要在后台迭代的对象,通常是生成器。
+        maxsize: 队列最多缓存的数据项数。
+
+    Yields:
+        iterable产生的数据项。
+    """
+    items: queue.Queue = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(kind: int, value: object) -> bool:
+        while not stop.is_set():
+            try:
+                items.put((kind, value), timeout=_PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put(_ITEM, item):
+                    return
+            put(_DONE, None)
+        except BaseException as e:
+            put(_ERROR, e)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            kind, value = items.get()
+            if kind == _DONE:
+                return
+            if kind == _ERROR:
+                raise value
+            yield value
+    finally:
+        stop.set()
+        thread.join()
+
+
+def iter_chunks(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    """将可迭代对象按固定大小分块。
+
+    Args:
+        iterable: 可迭代对象。
+        size: 每块的大小。
+
+    Yields:
+        数据块,最后一块可能不足size项。
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
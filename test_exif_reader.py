@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""exif_reader模块的测试。
+
+运行方式: python -m unittest test_exif_reader
+"""
+
+import io
+import struct
+import unittest
+from datetime import datetime
+
+from exif_reader import EXIF_HEADER, JPEG_SOI, parse_exif_date, parse_image_info
+
+_DATE = b"2021:01:01 00:00:00\x00"
+
+
+def _make_tiff(entries: bytes, entry_count: int, extra: bytes = b"") -> bytes:
+    """构造只有IFD0的小端TIFF数据。"""
+    return b"II" + struct.pack("<HI", 42, 8) + struct.pack("<H", entry_count) + (
+        entries + extra
+    )
+
+
+def _make_jpeg(tiff: bytes) -> bytes:
+    """构造只包含一个EXIF段的JPEG数据。"""
+    segment = EXIF_HEADER + tiff
+    return JPEG_SOI + b"\xff\xe1" + struct.pack(">H", len(segment) + 2) + segment
+
+
+class ParseExifDateTest(unittest.TestCase):
+    """parse_exif_date的测试。"""
+
+    def test_reads_date_time(self):
+        entry = struct.pack("<HHII", 0x0132, 2, len(_DATE), 26)
+        tiff = _make_tiff(entry, 1, struct.pack("<I", 0) + _DATE)
+        self.assertEqual(
+            parse_exif_date(io.BytesIO(_make_jpeg(tiff))), datetime(2021, 1, 1)
+        )
+
+    def test_truncated_value_offset_raises_value_error(self):
+        # DateTime条目的数量大于4,但值的偏移量被截断
+        entry = struct.pack("<HHI", 0x0132, 2, len(_DATE))
+        tiff = _make_tiff(entry, 1)
+        self.assertEqual(len(tiff), 18)
+        with self.assertRaises(ValueError):
+            parse_exif_date(io.BytesIO(_make_jpeg(tiff)))
+
+    def test_truncated_ifd_raises_value_error(self):
+        tiff = _make_tiff(b"\x32\x01", 3)
+        with self.assertRaises(ValueError):
+            parse_exif_date(io.BytesIO(_make_jpeg(tiff)))
+
+    def test_invalid_byte_order_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            parse_exif_date(io.BytesIO(_make_jpeg(b"XX" + b"\x00" * 16)))
+
+    def test_invalid_date_returns_none(self):
+        value = b"not a date at all!!\x00"
+        entry = struct.pack("<HHII", 0x0132, 2, len(value), 26)
+        tiff = _make_tiff(entry, 1, struct.pack("<I", 0) + value)
+        self.assertIsNone(parse_exif_date(io.BytesIO(_make_jpeg(tiff))))
+
+
+class ParseImageInfoTest(unittest.TestCase):
+    """parse_image_info的测试。"""
+
+    def test_malformed_exif_returns_none(self):
+        entry = struct.pack("<HHI", 0x0132, 2, len(_DATE))
+        self.assertIsNone(parse_image_info(_make_jpeg(_make_tiff(entry, 1))))
+
+    def test_truncated_header_returns_none(self):
+        self.assertIsNone(parse_image_info(JPEG_SOI + b"\xff\xe1\x00"))
+
+
+if __name__ == "__main__":
+    unittest.main()